@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-18 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='googleoauthtoken',
+            name='invalid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-18 17:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0002_google_token_invalid_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='googleoauthtoken',
+            name='refreshing_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
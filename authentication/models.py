@@ -9,6 +9,12 @@ class GoogleOAuthToken(models.Model):
     expires_in = models.IntegerField()
     expires_at = models.DateTimeField()
     scope = models.TextField()
+    # Set when Google rejects the refresh token (invalid_grant: revoked or
+    # long unused); the user has to connect Google again.
+    invalid_at = models.DateTimeField(null=True, blank=True)
+    # Lease taken by the process refreshing the token; others wait for it
+    # instead of calling Google too. Expires so a crashed holder is replaced.
+    refreshing_until = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -3,6 +3,8 @@ from django.contrib.auth import authenticate, login
 from django.utils import timezone
 from datetime import timedelta
 from calendar_api.services import GoogleCalendarService
+from calendar_api import google_api
+from calendar_api.watch import stop_user_watches
 from .models import GoogleOAuthToken
 from users.models import UserProfile
 import uuid
@@ -33,6 +35,8 @@ class AuthenticationService:
         
         # Save credentials
         self.google_service.save_credentials_to_user(user, credentials)
+        # The login may be for a different Google account than before.
+        self.google_service.invalidate_calendar_list(user)
         
         # Update user profile
         self._update_user_profile(user, user_info, credentials)
@@ -45,10 +49,8 @@ class AuthenticationService:
         return user
     
     def _get_google_user_info(self, credentials):
-        from googleapiclient.discovery import build
-        
-        service = build('oauth2', 'v2', credentials=credentials)
-        user_info = service.userinfo().get().execute()
+        service = google_api.build_service('oauth2', 'v2', credentials)
+        user_info = google_api.execute(service.userinfo().get())
         
         return {
             'google_id': user_info.get('id'),
@@ -139,14 +141,19 @@ class AuthenticationService:
             
         try:
             google_token = user.google_token
-            return not google_token.is_expired()
+            return google_token.invalid_at is None and not google_token.is_expired()
         except GoogleOAuthToken.DoesNotExist:
             return False
     
     def revoke_google_access(self, user):
         try:
+            # Stop push notifications while the tokens can still do it
+            stop_user_watches(user, self.google_service)
+            
             # Delete tokens
             GoogleOAuthToken.objects.filter(user=user).delete()
+            self.google_service.invalidate_credentials(user)
+            self.google_service.invalidate_calendar_list(user)
             
             # Clear profile tokens
             try:
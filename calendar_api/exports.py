@@ -0,0 +1,41 @@
+from itertools import islice
+from .serializers import EVENT_ROW_FIELDS, serialize_event_rows
+import json
+
+# Streaming bodies for /api/events/export/. Rows are read with a server-side
+# cursor and serialized one chunk at a time, so memory stays flat no matter
+# how many events are exported.
+EXPORT_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_event_row_chunks(queryset, chunk_size):
+    rows = queryset.values_list(*EVENT_ROW_FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield serialize_event_rows(chunk)
+
+
+def stream_events_json(queryset, chunk_size):
+    yield '['
+    separator = ''
+    for events in iter_event_row_chunks(queryset, chunk_size):
+        body = ','.join(json.dumps(event, separators=(',', ':')) for event in events)
+        yield separator + body
+        separator = ','
+    yield ']'
+
+
+def stream_events_ndjson(queryset, chunk_size):
+    for events in iter_event_row_chunks(queryset, chunk_size):
+        yield ''.join(json.dumps(event, separators=(',', ':')) + '\n' for event in events)
+
+
+def stream_events(queryset, output, chunk_size):
+    if output == 'ndjson':
+        return stream_events_ndjson(queryset, chunk_size)
+    return stream_events_json(queryset, chunk_size)
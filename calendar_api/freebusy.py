@@ -0,0 +1,44 @@
+from django.db.models import Q
+from .models import CalendarEvent
+from .recurrence import EVENT_ROW_END, expand_event_rows
+from .serializers import EVENT_ROW_FIELDS, EVENT_ROW_START
+
+EVENT_ROW_USER = EVENT_ROW_FIELDS.index('user_id')
+
+
+def busy_intervals(user_ids, start, end, calendar_ids=None):
+    # Merged busy intervals per user over [start, end), clipped to the
+    # window. Single events come from the bucketed overlap query, recurring
+    # ones from local expansion; cancelled events are never busy.
+    events = CalendarEvent.objects.overlapping_for_users(user_ids, start, end).filter(
+        Q(recurrence_rule__isnull=True) | Q(recurrence_rule='')
+    ).exclude(status='cancelled')
+    masters = CalendarEvent.objects.filter(
+        user__in=user_ids, start_datetime__lt=end, recurrence_rule__gt=''
+    ).exclude(status='cancelled')
+    if calendar_ids:
+        events = events.filter(calendar_id__in=calendar_ids)
+        masters = masters.filter(calendar_id__in=calendar_ids)
+
+    intervals = {user_id: [] for user_id in user_ids}
+    for user_id, event_start, event_end in events.values_list('user_id', 'start_datetime', 'end_datetime'):
+        intervals[user_id].append((max(event_start, start), min(event_end, end)))
+    for row in expand_event_rows(masters.values_list(*EVENT_ROW_FIELDS), start, end, overlap=True):
+        intervals[row[EVENT_ROW_USER]].append(
+            (max(row[EVENT_ROW_START], start), min(row[EVENT_ROW_END], end))
+        )
+
+    return {user_id: merge_intervals(user_intervals) for user_id, user_intervals in intervals.items()}
+
+
+def merge_intervals(intervals):
+    # Sorted sweep: an interval starting at or before the end of the current
+    # run extends it, anything later starts a new run.
+    merged = []
+    for interval_start, interval_end in sorted(intervals):
+        if merged and interval_start <= merged[-1][1]:
+            if interval_end > merged[-1][1]:
+                merged[-1][1] = interval_end
+        else:
+            merged.append([interval_start, interval_end])
+    return merged
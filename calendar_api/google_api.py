@@ -0,0 +1,424 @@
+from collections import OrderedDict
+from django.conf import settings
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
+import json
+import random
+import threading
+import time
+
+# Parsed discovery documents, keyed by (service name, version). They are
+# loaded from the copies bundled with googleapiclient, never fetched.
+_discovery_documents = {}
+_discovery_lock = threading.Lock()
+
+# Keep-alive transports shared by every Google call in the process; built
+# from GOOGLE_HTTP_POOL_SIZE and GOOGLE_HTTP_IDLE_TIMEOUT on first use.
+_http_pool = None
+_http_pool_lock = threading.Lock()
+
+# Built service objects per user: user id -> (access token, service).
+_service_cache = OrderedDict()
+_service_lock = threading.Lock()
+
+# Shared by every Google call in the process; built from GOOGLE_API_RATE_LIMIT
+# on first use unless set_rate_limit() was called.
+_rate_limiter = None
+_rate_limit_set = False
+
+# Per-user buckets (GOOGLE_API_USER_RATE_LIMIT): user id -> TokenBucket.
+_user_limiters = OrderedDict()
+_user_limiter_lock = threading.Lock()
+
+# Off (the default) in web processes, where a caller is waiting: retries
+# stop at GOOGLE_API_REQUEST_MAX_RETRIES or once GOOGLE_API_REQUEST_RETRY_BUDGET
+# seconds have been spent backing off. Background commands turn it on to
+# retry up to GOOGLE_API_MAX_RETRIES times.
+_background_retries = False
+
+# 403 reasons Google uses for quota errors; other 403s are permanent.
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+def get_discovery_document(service_name, version):
+    key = (service_name, version)
+    document = _discovery_documents.get(key)
+    if document is not None:
+        return document
+
+    with _discovery_lock:
+        document = _discovery_documents.get(key)
+        if document is None:
+            content = discovery_cache.get_static_doc(service_name, version)
+            if content is None:
+                raise ValueError(f"No bundled discovery document for {service_name} {version}")
+            document = json.loads(content)
+            _discovery_documents[key] = document
+    return document
+
+
+def build_service(service_name, version, credentials):
+    return build_from_document(
+        get_discovery_document(service_name, version),
+        http=authorized_http(credentials)
+    )
+
+
+def authorized_http(credentials):
+    return AuthorizedHttp(credentials, http=PooledHttp())
+
+
+def get_user_service(user_id, credentials, service_name='calendar', version='v3'):
+    key = (user_id, service_name, version)
+
+    with _service_lock:
+        cached = _service_cache.get(key)
+        if cached is not None and cached[0] == credentials.token:
+            _service_cache.move_to_end(key)
+            return cached[1]
+
+    # A different token means the credentials were refreshed or replaced;
+    # the old service is bound to them and must not be reused.
+    service = build_service(service_name, version, credentials)
+
+    with _service_lock:
+        _service_cache[key] = (credentials.token, service)
+        _service_cache.move_to_end(key)
+        while len(_service_cache) > settings.GOOGLE_SERVICE_CACHE_SIZE:
+            _service_cache.popitem(last=False)
+    return service
+
+
+def evict_user_services(user_id):
+    with _service_lock:
+        for key in [key for key in _service_cache if key[0] == user_id]:
+            del _service_cache[key]
+
+
+class HttpPool:
+    # Idle httplib2 transports, most recently used first. httplib2.Http is
+    # not thread-safe, so each request checks one out for itself; the
+    # transport keeps its connections to Google open between requests, so
+    # only its first request pays for TCP and TLS setup. At most ``size``
+    # idle transports are kept, and one idle for ``idle_timeout`` seconds or
+    # more is closed instead of reused, since Google will have dropped the
+    # connection by then.
+    def __init__(self, size, idle_timeout):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        now = time.monotonic()
+        with self.lock:
+            while self.idle:
+                released_at, http = self.idle.pop()
+                if now - released_at < self.idle_timeout:
+                    return http
+                # Everything below it has been idle even longer.
+                stale = [http] + [http for _, http in self.idle]
+                self.idle = []
+                break
+            else:
+                stale = []
+        for http in stale:
+            http.close()
+        return build_http()
+
+    def release(self, http):
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append((time.monotonic(), http))
+                return
+        http.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for _, http in idle:
+            http.close()
+
+
+class PooledHttp:
+    # Stands in for httplib2.Http under AuthorizedHttp: every request runs on
+    # a transport from the process pool, so services and threads share
+    # warm connections without sharing a transport.
+    follow_redirects = True
+    redirect_codes = httplib2.REDIRECT_CODES - {308}
+
+    def __init__(self, pool=None):
+        self.pool = pool
+        self.connections = {}
+        self.timeout = None
+
+    def request(self, *args, **kwargs):
+        pool = self.pool or get_http_pool()
+        http = pool.acquire()
+        try:
+            response = http.request(*args, **kwargs)
+        except Exception:
+            # The connection may be half-used; never hand it out again.
+            http.close()
+            raise
+        pool.release(http)
+        return response
+
+    def close(self):
+        # The transports belong to the pool, not to this client.
+        pass
+
+
+def get_http_pool():
+    global _http_pool
+    with _http_pool_lock:
+        if _http_pool is None:
+            _http_pool = HttpPool(settings.GOOGLE_HTTP_POOL_SIZE, settings.GOOGLE_HTTP_IDLE_TIMEOUT)
+        return _http_pool
+
+
+def close_http_pool():
+    # Closes every idle connection; the next request starts a new pool.
+    global _http_pool
+    with _http_pool_lock:
+        pool, _http_pool = _http_pool, None
+    if pool is not None:
+        pool.close()
+
+
+class GoogleAPIUnavailable(Exception):
+    # Raised without calling Google while the circuit breaker is open.
+    pass
+
+
+class TokenBucket:
+    # Thread-safe token bucket: refills at ``rate`` tokens per second and
+    # holds at most ``capacity``, which bounds bursts. The rate adapts to
+    # Google's answers: halved by slow_down() on a quota error, recovered
+    # a step at a time by speed_up(), never above the configured rate.
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.max_rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        # A request costing more than a full bucket waits for a full bucket.
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def slow_down(self):
+        with self.lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def speed_up(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 16)
+
+
+class CircuitBreaker:
+    # Opens after GOOGLE_API_CIRCUIT_THRESHOLD consecutive failures (5xx and
+    # network errors; quota errors are left to the rate limiters) and fails calls fast for
+    # GOOGLE_API_CIRCUIT_RESET seconds. After that a single trial call is let
+    # through (half-open): success closes the circuit, failure reopens it.
+    def __init__(self, threshold=None, reset_timeout=None):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        reset_timeout = self.reset_timeout or settings.GOOGLE_API_CIRCUIT_RESET
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < reset_timeout:
+                return False
+            # Restarting the clock keeps other callers out while the trial
+            # runs, and lets another trial through if this one never reports.
+            self.opened_at = now
+            self.trial = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        threshold = self.threshold or settings.GOOGLE_API_CIRCUIT_THRESHOLD
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= threshold:
+                self.opened_at = time.monotonic()
+                self.trial = False
+
+    @property
+    def is_open(self):
+        with self.lock:
+            return self.opened_at is not None
+
+
+_circuit_breaker = CircuitBreaker()
+
+
+def set_rate_limit(rate, capacity=None):
+    # ``rate`` requests per second for this process; 0 or None removes it.
+    global _rate_limiter, _rate_limit_set
+    _rate_limiter = TokenBucket(rate, capacity) if rate else None
+    _rate_limit_set = True
+
+
+def get_rate_limiter():
+    if not _rate_limit_set:
+        set_rate_limit(settings.GOOGLE_API_RATE_LIMIT)
+    return _rate_limiter
+
+
+def get_user_rate_limiter(user_id):
+    if user_id is None or not settings.GOOGLE_API_USER_RATE_LIMIT:
+        return None
+    with _user_limiter_lock:
+        limiter = _user_limiters.get(user_id)
+        if limiter is None:
+            limiter = _user_limiters[user_id] = TokenBucket(settings.GOOGLE_API_USER_RATE_LIMIT)
+        _user_limiters.move_to_end(user_id)
+        while len(_user_limiters) > settings.GOOGLE_SERVICE_CACHE_SIZE:
+            _user_limiters.popitem(last=False)
+    return limiter
+
+
+def set_background_retries(enabled=True):
+    global _background_retries
+    _background_retries = enabled
+
+
+def reset_limits():
+    # Back to the configured limits with a closed circuit.
+    global _rate_limiter, _rate_limit_set, _circuit_breaker, _background_retries
+    _rate_limiter = None
+    _rate_limit_set = False
+    _background_retries = False
+    _circuit_breaker = CircuitBreaker()
+    with _user_limiter_lock:
+        _user_limiters.clear()
+
+
+def execute(request, http=None, user_id=None, cost=1):
+    # Every Google call goes through here: rate limited globally and per
+    # user, retried with exponential backoff and full jitter on quota
+    # errors, 429, 5xx and network errors, and short-circuited while Google
+    # keeps failing. ``cost`` is the number of API calls in the request
+    # (a batch counts each of its parts against the quota).
+    breaker = _circuit_breaker
+    if _background_retries:
+        max_retries, budget = settings.GOOGLE_API_MAX_RETRIES, None
+    else:
+        max_retries, budget = settings.GOOGLE_API_REQUEST_MAX_RETRIES, settings.GOOGLE_API_REQUEST_RETRY_BUDGET
+    attempt = 0
+    waited = 0
+    while True:
+        if not breaker.allow():
+            raise GoogleAPIUnavailable('Google API unavailable after repeated failures; retry later')
+
+        global_limiter = get_rate_limiter()
+        user_limiter = get_user_rate_limiter(user_id)
+        for limiter in (global_limiter, user_limiter):
+            if limiter:
+                limiter.acquire(cost)
+
+        try:
+            response = request.execute(http=http)
+        except HttpError as e:
+            reason = rate_limit_reason(e)
+            throttled = bool(reason) or e.resp.status == 429
+            if not throttled and e.resp.status < 500:
+                # Google answered; the request itself is at fault.
+                breaker.record_success()
+                raise
+            if throttled:
+                # Quota errors say nothing about Google's health (and are
+                # often one user's alone), so they slow the bucket they name
+                # down instead of counting toward the breaker.
+                limiter = user_limiter if reason == 'userRateLimitExceeded' else global_limiter
+                if limiter:
+                    limiter.slow_down()
+            else:
+                breaker.record_failure()
+            delay = _retry_delay(attempt, max_retries, budget, waited, _retry_after(e))
+            if delay is None:
+                raise
+        except (httplib2.HttpLib2Error, ConnectionError, TimeoutError):
+            breaker.record_failure()
+            delay = _retry_delay(attempt, max_retries, budget, waited)
+            if delay is None:
+                raise
+        else:
+            breaker.record_success()
+            for limiter in (global_limiter, user_limiter):
+                if limiter:
+                    limiter.speed_up()
+            return response
+
+        time.sleep(delay)
+        waited += delay
+        attempt += 1
+
+
+def _retry_delay(attempt, max_retries, budget, waited, retry_after=0):
+    # None when the call should not be retried. Under a budget the backoff
+    # is trimmed to what is left of it, but a longer Retry-After from
+    # Google means giving up rather than retrying too early.
+    if attempt >= max_retries:
+        return None
+    if budget is None:
+        return min(max(backoff_delay(attempt), retry_after), settings.GOOGLE_API_BACKOFF_MAX)
+    remaining = budget - waited
+    if retry_after > remaining:
+        return None
+    return max(min(backoff_delay(attempt), remaining), retry_after)
+
+
+def backoff_delay(attempt):
+    return random.uniform(0, min(
+        settings.GOOGLE_API_BACKOFF_MAX, settings.GOOGLE_API_BACKOFF_BASE * 2 ** attempt
+    ))
+
+
+def rate_limit_reason(error):
+    if error.resp.status != 403:
+        return None
+    try:
+        details = json.loads(error.content.decode('utf-8'))['error']['errors']
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+    for detail in details:
+        if isinstance(detail, dict) and detail.get('reason') in RATE_LIMIT_REASONS:
+            return detail['reason']
+    return None
+
+
+def _retry_after(error):
+    try:
+        return float(error.resp.get('retry-after', 0))
+    except (TypeError, ValueError):
+        return 0
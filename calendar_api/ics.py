@@ -0,0 +1,320 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+from itertools import islice
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import CalendarEvent, CalendarEventBucket, GoogleOutboxEntry
+from .outbox import enqueue_event_pushes
+import re
+
+# iCalendar (RFC 5545) export and import for CalendarEvent. Both directions
+# work a chunk of events at a time, so neither the exported calendar nor an
+# uploaded file is ever held in memory as a whole.
+PRODID = '-//google-calendar-backend//Calendar API//EN'
+UID_DOMAIN = 'google-calendar-backend'
+
+# Stored in recurrence_rule one per line, the way Google returns them.
+RECURRENCE_PROPERTIES = ('RRULE', 'EXRULE', 'RDATE', 'EXDATE')
+STATUSES = ('confirmed', 'tentative', 'cancelled')
+
+ICS_EVENT_FIELDS = (
+    'id', 'google_event_id', 'title', 'description', 'start_datetime',
+    'end_datetime', 'location', 'is_all_day', 'recurrence_rule', 'status',
+    'updated_at'
+)
+
+_UNESCAPE = re.compile(r'\\([\\;,nN])')
+_DURATION = re.compile(
+    r'^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$'
+)
+
+
+class ICSParseError(ValueError):
+    pass
+
+
+def stream_ics(queryset, chunk_size):
+    yield fold_lines([
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+    ])
+    rows = queryset.values_list(*ICS_EVENT_FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        yield ''.join(format_vevent(dict(zip(ICS_EVENT_FIELDS, row))) for row in chunk)
+    yield fold_lines(['END:VCALENDAR'])
+
+
+def format_vevent(event):
+    uid = event['google_event_id'] or f"event-{event['id']}@{UID_DOMAIN}"
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{uid}',
+        f"DTSTAMP:{format_utc(event['updated_at'])}",
+    ]
+
+    if event['is_all_day']:
+        # All-day events are stored as UTC midnights with an exclusive end,
+        # which is exactly what DATE values mean in iCalendar.
+        start = event['start_datetime'].astimezone(dt_timezone.utc).date()
+        end = event['end_datetime'].astimezone(dt_timezone.utc).date()
+        if end <= start:
+            end = start + timedelta(days=1)
+        lines.append(f"DTSTART;VALUE=DATE:{start.strftime('%Y%m%d')}")
+        lines.append(f"DTEND;VALUE=DATE:{end.strftime('%Y%m%d')}")
+    else:
+        lines.append(f"DTSTART:{format_utc(event['start_datetime'])}")
+        lines.append(f"DTEND:{format_utc(event['end_datetime'])}")
+
+    lines.append(f"SUMMARY:{escape_text(event['title'])}")
+    if event['description']:
+        lines.append(f"DESCRIPTION:{escape_text(event['description'])}")
+    if event['location']:
+        lines.append(f"LOCATION:{escape_text(event['location'])}")
+    if event['status'] in STATUSES:
+        lines.append(f"STATUS:{event['status'].upper()}")
+
+    for rule in (event['recurrence_rule'] or '').splitlines():
+        rule = rule.strip()
+        if not rule:
+            continue
+        name = re.split('[:;]', rule, maxsplit=1)[0].upper()
+        lines.append(rule if name in RECURRENCE_PROPERTIES else f'RRULE:{rule}')
+
+    lines.append('END:VEVENT')
+    return fold_lines(lines)
+
+
+def format_utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def escape_text(value):
+    return (
+        value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def unescape_text(value):
+    return _UNESCAPE.sub(lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def fold_lines(lines):
+    return ''.join(fold_line(line) + '\r\n' for line in lines)
+
+
+def fold_line(line):
+    # Content lines are limited to 75 octets; longer ones continue on lines
+    # starting with a space. Splits never fall inside a UTF-8 sequence.
+    if len(line.encode()) <= 75:
+        return line
+    parts = []
+    current = []
+    size = 0
+    limit = 75
+    for char in line:
+        width = len(char.encode())
+        if size + width > limit:
+            parts.append(''.join(current))
+            current = []
+            size = 0
+            limit = 74
+        current.append(char)
+        size += width
+    parts.append(''.join(current))
+    return '\r\n '.join(parts)
+
+
+def unfold_lines(lines):
+    # Accepts any iterable of lines (str or bytes), e.g. an uploaded file.
+    # Continuations are joined before decoding, since a folded line may be
+    # split inside a multi-byte character.
+    current = None
+    for line in lines:
+        if isinstance(line, str):
+            line = line.encode()
+        line = line.rstrip(b'\r\n')
+        if line[:1] in (b' ', b'\t'):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current:
+            yield _decode_line(current)
+        current = line
+    if current:
+        yield _decode_line(current)
+
+
+def _decode_line(line):
+    try:
+        return line.decode('utf-8').lstrip('\ufeff')
+    except UnicodeDecodeError:
+        raise ICSParseError('File is not valid UTF-8')
+
+
+def parse_property(line):
+    head, separator, value = line.partition(':')
+    if '"' in head:
+        # A quoted parameter value may itself contain ':' or ';'.
+        head, separator, value = _split_quoted(line)
+    if not separator:
+        raise ICSParseError(f'Invalid content line: {line[:75]}')
+
+    name, *raw_params = head.split(';')
+    params = {}
+    for raw_param in raw_params:
+        key, _, param_value = raw_param.partition('=')
+        params[key.upper()] = param_value.strip('"')
+    return name.upper(), params, value
+
+
+def _split_quoted(line):
+    in_quotes = False
+    for index, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ':' and not in_quotes:
+            return line[:index], ':', line[index + 1:]
+    return line, '', ''
+
+
+def iter_vevents(lines):
+    # Yields one dict per VEVENT mapping property name -> (params, value);
+    # recurrence lines are collected as-is under 'recurrence'. Nested
+    # components (VALARM) and VTIMEZONE definitions are skipped.
+    components = []
+    vevent = None
+
+    for line in unfold_lines(lines):
+        name, params, value = parse_property(line)
+        if name == 'BEGIN':
+            components.append(value.upper())
+            if components[-1] == 'VEVENT':
+                vevent = {'recurrence': []}
+            continue
+        if name == 'END':
+            if components and components.pop() == 'VEVENT' and vevent is not None:
+                yield vevent
+                vevent = None
+            continue
+        if vevent is None or components[-1] != 'VEVENT':
+            continue
+        if name in RECURRENCE_PROPERTIES:
+            vevent['recurrence'].append(line)
+        else:
+            vevent[name] = (params, value)
+
+
+def event_fields_from_vevent(vevent):
+    if 'DTSTART' not in vevent:
+        raise ICSParseError('VEVENT without DTSTART')
+
+    start, is_all_day = parse_ics_datetime(*vevent['DTSTART'])
+    if 'DTEND' in vevent:
+        end, _ = parse_ics_datetime(*vevent['DTEND'])
+    elif 'DURATION' in vevent:
+        end = start + parse_duration(vevent['DURATION'][1])
+    else:
+        end = start + timedelta(days=1) if is_all_day else start
+    if end < start:
+        raise ICSParseError('VEVENT ends before it starts')
+
+    status = vevent.get('STATUS', ({}, ''))[1].strip().lower()
+    return {
+        'title': _text(vevent, 'SUMMARY')[:255] or 'No Title',
+        'description': _text(vevent, 'DESCRIPTION') or None,
+        'start_datetime': start,
+        'end_datetime': end,
+        'location': _text(vevent, 'LOCATION')[:255] or None,
+        'is_all_day': is_all_day,
+        'recurrence_rule': '\n'.join(vevent['recurrence']) or None,
+        'status': status if status in STATUSES else 'confirmed',
+    }
+
+
+def _text(vevent, name):
+    return unescape_text(vevent[name][1]) if name in vevent else ''
+
+
+def parse_ics_datetime(params, value):
+    value = value.strip()
+    try:
+        if params.get('VALUE', '').upper() == 'DATE' or len(value) == 8:
+            day = datetime(int(value[0:4]), int(value[4:6]), int(value[6:8]), tzinfo=dt_timezone.utc)
+            return day, True
+        if len(value) < 15 or value[8] != 'T':
+            raise ValueError(value)
+        local = datetime(
+            int(value[0:4]), int(value[4:6]), int(value[6:8]),
+            int(value[9:11]), int(value[11:13]), int(value[13:15])
+        )
+    except ValueError:
+        raise ICSParseError(f'Invalid date-time: {value}')
+
+    if value.endswith('Z'):
+        return local.replace(tzinfo=dt_timezone.utc), False
+    # Floating times (no TZID) are read in the server's time zone.
+    zone = _zone(params['TZID']) if 'TZID' in params else timezone.get_default_timezone()
+    return local.replace(tzinfo=zone).astimezone(dt_timezone.utc), False
+
+
+@lru_cache(maxsize=64)
+def _zone(tzid):
+    try:
+        return ZoneInfo(tzid.lstrip('/'))
+    except (ZoneInfoNotFoundError, ValueError):
+        return timezone.get_default_timezone()
+
+
+def parse_duration(value):
+    match = _DURATION.match(value.strip())
+    if not match or not any(match.groups()[1:]):
+        raise ICSParseError(f'Invalid duration: {value}')
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = timedelta(
+        weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+        minutes=int(minutes or 0), seconds=int(seconds or 0)
+    )
+    return -duration if sign == '-' else duration
+
+
+def import_events(user, lines, calendar_id='primary', push=True, chunk_size=None):
+    # Single pass over the file: events are written in chunks through the
+    # same bulk path as /api/events/bulk/. The whole import is one
+    # transaction, so a malformed file leaves nothing behind; events that
+    # parse but cannot be stored (no DTSTART, bad dates) are skipped.
+    chunk_size = chunk_size or settings.EVENTS_IMPORT_CHUNK_SIZE
+    imported = 0
+    skipped = 0
+    chunk = []
+
+    with transaction.atomic():
+        for vevent in iter_vevents(lines):
+            try:
+                fields = event_fields_from_vevent(vevent)
+            except ICSParseError:
+                skipped += 1
+                continue
+            chunk.append(CalendarEvent(user=user, calendar_id=calendar_id, **fields))
+            if len(chunk) >= chunk_size:
+                imported += _save_events(chunk, push)
+                chunk = []
+        if chunk:
+            imported += _save_events(chunk, push)
+
+    return imported, skipped
+
+
+def _save_events(events, push):
+    events = CalendarEvent.objects.bulk_create(events)
+    CalendarEventBucket.rebuild_for(events)
+    if push:
+        enqueue_event_pushes(events, GoogleOutboxEntry.CREATE)
+    return len(events)
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from calendar_api.ics import stream_ics
+from calendar_api.models import CalendarEvent
+
+
+class Command(BaseCommand):
+    help = "Export a user's events as an iCalendar (.ics) file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Username whose events are exported')
+        parser.add_argument('--calendar-id', help='Only export events from this calendar')
+        parser.add_argument('--output', help='File to write (defaults to stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist")
+
+        queryset = CalendarEvent.objects.filter(user=user)
+        if options['calendar_id']:
+            queryset = queryset.filter(calendar_id=options['calendar_id'])
+        chunks = stream_ics(queryset.order_by('start_datetime', 'id'), settings.EVENTS_EXPORT_CHUNK_SIZE)
+
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        # newline='' keeps the CRLF line endings iCalendar requires.
+        with open(options['output'], 'w', encoding='utf-8', newline='') as ics_file:
+            for chunk in chunks:
+                ics_file.write(chunk)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+from calendar_api.models import GoogleWatchChannel
+from calendar_api.watch import notification_headers, wait_for_pending_syncs
+import urllib.error
+import urllib.request
+
+
+class Command(BaseCommand):
+    help = 'Send a Google-style push notification for a watch channel, for local testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('channel_id', help='Channel to notify (see GoogleWatchChannel)')
+        parser.add_argument(
+            '--state', default='exists', choices=['sync', 'exists', 'not_exists'],
+            help='X-Goog-Resource-State to send'
+        )
+        parser.add_argument(
+            '--url',
+            help='POST to this webhook URL instead of calling the view in-process'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            channel = GoogleWatchChannel.objects.get(channel_id=options['channel_id'])
+        except GoogleWatchChannel.DoesNotExist:
+            raise CommandError(f"Watch channel {options['channel_id']} does not exist")
+
+        headers = notification_headers(channel, options['state'])
+        if options['url']:
+            request = urllib.request.Request(options['url'], data=b'', headers=headers, method='POST')
+            try:
+                with urllib.request.urlopen(request) as response:
+                    status_code = response.status
+            except urllib.error.HTTPError as e:
+                status_code = e.code
+        else:
+            status_code = Client().post(
+                reverse('google_webhook'),
+                headers=headers,
+            ).status_code
+            # The sync runs on a timer thread; let it finish before exiting.
+            wait_for_pending_syncs()
+
+        self.stdout.write(f'Webhook answered {status_code}')
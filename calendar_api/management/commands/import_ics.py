@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from calendar_api.ics import ICSParseError, import_events
+
+
+class Command(BaseCommand):
+    help = 'Import events from an iCalendar (.ics) file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the .ics file')
+        parser.add_argument('--user', required=True, help='Username that will own the events')
+        parser.add_argument(
+            '--calendar-id', default='primary',
+            help='Calendar the imported events are placed in'
+        )
+        parser.add_argument(
+            '--no-push', action='store_true',
+            help='Do not queue the imported events for pushing to Google'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist")
+
+        try:
+            with open(options['path'], 'rb') as ics_file:
+                imported, skipped = import_events(
+                    user, ics_file,
+                    calendar_id=options['calendar_id'],
+                    push=not options['no_push'],
+                )
+        except (OSError, ICSParseError) as e:
+            raise CommandError(f"Error importing {options['path']}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} events ({skipped} skipped)'
+        ))
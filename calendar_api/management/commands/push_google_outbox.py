@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from itertools import groupby
+from calendar_api import google_api
+from calendar_api.outbox import claim_due_entries, process_entries
+import time
+
+
+class Command(BaseCommand):
+    help = 'Push queued local event changes to Google Calendar'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.GOOGLE_OUTBOX_WORKERS,
+            help='Number of users pushed concurrently'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Maximum outbox entries claimed per pass'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=2,
+            help='Seconds to wait when the outbox is empty'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Drain the due entries once and exit'
+        )
+
+    def handle(self, *args, **options):
+        google_api.set_background_retries()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                entries = claim_due_entries(options['batch_size'])
+                if entries:
+                    pushed = self.push(pool, entries)
+                    self.stdout.write(f'Pushed {pushed}/{len(entries)} outbox entries')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+
+    def push(self, pool, entries):
+        # One task per user keeps each user's changes in order and on a
+        # single thread; different users are pushed in parallel.
+        entries.sort(key=lambda entry: (entry.user_id, entry.created_at, entry.id))
+        futures = [
+            pool.submit(process_entries, list(user_entries))
+            for _, user_entries in groupby(entries, key=lambda entry: entry.user_id)
+        ]
+        return sum(future.result() for future in futures)
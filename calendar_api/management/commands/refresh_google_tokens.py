@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+from authentication.models import GoogleOAuthToken
+from calendar_api.services import GoogleCalendarService
+import time
+
+
+class Command(BaseCommand):
+    help = 'Refresh Google OAuth tokens that are about to expire'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window', type=int, default=settings.GOOGLE_TOKEN_REFRESH_WINDOW,
+            help='Refresh tokens expiring within this many seconds'
+        )
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running and rescan every N seconds (0 runs once)'
+        )
+
+    def handle(self, *args, **options):
+        google_service = GoogleCalendarService()
+
+        while True:
+            self.refresh_expiring(google_service, options['window'])
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def refresh_expiring(self, google_service, window):
+        deadline = timezone.now() + timedelta(seconds=window)
+        # Tokens Google has rejected stay skipped until the user reconnects.
+        tokens = GoogleOAuthToken.objects.filter(
+            expires_at__lte=deadline, invalid_at__isnull=True
+        ).select_related('user')
+
+        refreshed = 0
+        failed = 0
+        for token in tokens:
+            user = token.user
+            try:
+                google_service.refresh_credentials(user, force=True)
+                refreshed += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Error refreshing token for user {user.username}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {refreshed} tokens ({failed} failed)'
+        ))
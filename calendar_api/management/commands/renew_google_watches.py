@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from calendar_api import google_api
+from calendar_api.services import GoogleCalendarService
+from calendar_api.watch import renew_expiring_watches
+import time
+
+
+class Command(BaseCommand):
+    help = 'Replace Google push-notification channels that are about to expire'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window', type=int, default=settings.GOOGLE_WATCH_RENEW_WINDOW,
+            help='Renew channels expiring within this many seconds'
+        )
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running and rescan every N seconds (0 runs once)'
+        )
+
+    def handle(self, *args, **options):
+        google_api.set_background_retries()
+        google_service = GoogleCalendarService()
+
+        while True:
+            renewed, failed = renew_expiring_watches(options['window'], google_service)
+            self.stdout.write(self.style.SUCCESS(
+                f'Renewed {renewed} watch channels ({failed} failed)'
+            ))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
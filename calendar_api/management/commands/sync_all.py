@@ -0,0 +1,245 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from django.db.models import F, Max, OuterRef, Subquery
+from django.utils import timezone
+from calendar_api import google_api
+from calendar_api.models import GoogleSyncState
+from calendar_api.services import GoogleCalendarService
+import json
+import multiprocessing
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = "Sync every Google-connected user's calendars, most stale first"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=settings.GOOGLE_SYNC_PROCESSES,
+            help='Worker processes (0 syncs in this process)'
+        )
+        parser.add_argument(
+            '--shard-size', type=int, default=25,
+            help='Users handed to a worker at a time; progress is checkpointed per shard'
+        )
+        parser.add_argument(
+            '--rate', type=float, default=settings.GOOGLE_API_RATE_LIMIT,
+            help='Google API requests per second across all workers (0 for no limit)'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=0,
+            help='Sync at most this many users per pass (0 for all)'
+        )
+        parser.add_argument(
+            '--checkpoint', default=settings.GOOGLE_SYNC_CHECKPOINT,
+            help='File recording finished users so an interrupted pass resumes'
+        )
+        parser.add_argument(
+            '--fresh', action='store_true',
+            help='Ignore an existing checkpoint and start a new pass'
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Drop stored sync tokens and list every calendar again'
+        )
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running and start a new pass every N seconds (0 runs once)'
+        )
+
+    def handle(self, *args, **options):
+        # Inherited by the forked workers.
+        google_api.set_background_retries()
+        while True:
+            self.run_pass(options)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def run_pass(self, options):
+        checkpoint = self.load_checkpoint(options)
+        done = set(checkpoint['done'])
+        users = [user for user in self.stale_users() if user['id'] not in done]
+        if options['limit']:
+            users = users[:options['limit']]
+        if done:
+            self.stdout.write(f"Resuming pass from {checkpoint['started_at']}: {len(done)} users already synced")
+        if not users:
+            self.clear_checkpoint(options['checkpoint'])
+            self.stdout.write(self.style.SUCCESS('No users to sync'))
+            return
+
+        now = timezone.now()
+        lags = [
+            (now - user['last_synced']).total_seconds() if user['last_synced'] else None
+            for user in users
+        ]
+        known_lags = [lag for lag in lags if lag is not None]
+        self.stdout.write(
+            f"Syncing {len(users)} users"
+            f" (never synced: {lags.count(None)}"
+            f", max lag: {max(known_lags, default=0):.0f}s"
+            f", mean lag: {sum(known_lags) / len(known_lags) if known_lags else 0:.0f}s)"
+        )
+
+        shards = [
+            [user['id'] for user in users[i:i + options['shard_size']]]
+            for i in range(0, len(users), options['shard_size'])
+        ]
+        totals = {'users': 0, 'events': 0, 'failed': 0}
+        started = time.monotonic()
+
+        for results in self.run_shards(shards, options):
+            for result in results:
+                totals['users'] += 1
+                totals['events'] += result['events']
+                if result['error'] or result['failed']:
+                    totals['failed'] += 1
+                else:
+                    # Only users that synced are skipped when a pass resumes.
+                    done.add(result['user_id'])
+            self.save_checkpoint(options['checkpoint'], checkpoint['started_at'], done)
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"{totals['users']}/{len(users)} users, {totals['events']} events, "
+                f"{totals['failed']} failed, "
+                f"{totals['users'] / elapsed:.1f} users/s, {totals['events'] / elapsed:.1f} events/s"
+            )
+
+        self.clear_checkpoint(options['checkpoint'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {totals['users']} users ({totals['events']} events, {totals['failed']} failed) "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
+
+    def stale_users(self):
+        # Users with Google tokens, least recently synced first; a user was
+        # last synced when their most recent calendar sync finished, so users
+        # with empty calendars are not mistaken for never synced.
+        last_synced = GoogleSyncState.objects.filter(user=OuterRef('pk')).values('user').annotate(
+            last=Max('last_synced_at')
+        ).values('last')
+        return list(
+            User.objects.filter(google_token__isnull=False, google_token__invalid_at__isnull=True)
+            .annotate(last_synced=Subquery(last_synced))
+            .order_by(F('last_synced').asc(nulls_first=True), 'id')
+            .values('id', 'last_synced')
+        )
+
+    def run_shards(self, shards, options):
+        if options['processes'] <= 0:
+            google_api.set_rate_limit(options['rate'])
+            for shard in shards:
+                yield sync_shard(shard, options['full'])
+            return
+
+        processes = min(options['processes'], len(shards))
+        # Each process takes an equal share of the project's quota.
+        rate = options['rate'] / processes if options['rate'] else 0
+        pending = list(shards)
+        suspects = []
+        while pending or suspects:
+            # Shards that were in flight when a worker died are rerun one at
+            # a time, so only the shard that kills its worker fails.
+            alone = not pending
+            queue = [suspects.pop(0)] if alone else pending
+            crashed = []
+            yield from self.run_pool(queue, 1 if alone else processes, rate, options, crashed)
+            if crashed and alone:
+                self.stderr.write(f"Error syncing shard of {len(crashed[0])} users: worker process died")
+                yield failed_results(crashed[0], 'worker process died')
+            elif crashed:
+                self.stderr.write(f"Worker process died; retrying {len(crashed)} shards one at a time")
+                suspects.extend(crashed)
+
+    def run_pool(self, queue, processes, rate, options, crashed):
+        # Keeps at most ``processes`` shards in flight, so when a worker dies
+        # the shards that may have been running are exactly the outstanding
+        # ones. They are handed back through ``crashed``; shards still in
+        # ``queue`` are left for the next pool.
+        # Connections must not be shared with the forked workers.
+        connections.close_all()
+        google_api.close_http_pool()
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=init_worker,
+            initargs=(rate,),
+        ) as pool:
+            futures = {}
+            while queue or futures:
+                while queue and len(futures) < processes:
+                    shard = queue.pop(0)
+                    futures[pool.submit(sync_shard, shard, options['full'])] = shard
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in finished:
+                    shard = futures.pop(future)
+                    try:
+                        results = future.result()
+                    except BrokenProcessPool:
+                        crashed.append(shard)
+                        broken = True
+                        continue
+                    except Exception as e:
+                        self.stderr.write(f"Error syncing shard of {len(shard)} users: {e}")
+                        results = failed_results(shard, str(e))
+                    yield results
+                if broken:
+                    crashed.extend(futures.values())
+                    return
+
+    def load_checkpoint(self, options):
+        path = options['checkpoint']
+        if path and not options['fresh'] and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                return json.load(checkpoint_file)
+        return {'started_at': timezone.now().isoformat(), 'done': []}
+
+    def save_checkpoint(self, path, started_at, done):
+        if not path:
+            return
+        # Written to a temporary file and renamed so a crash never leaves a
+        # half-written checkpoint.
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as checkpoint_file:
+            json.dump({'started_at': started_at, 'done': sorted(done)}, checkpoint_file)
+        os.replace(temporary, path)
+
+    def clear_checkpoint(self, path):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+def failed_results(user_ids, error):
+    return [{'user_id': user_id, 'events': 0, 'failed': [], 'error': error} for user_id in user_ids]
+
+
+def init_worker(rate):
+    google_api.set_rate_limit(rate)
+
+
+def sync_shard(user_ids, full_sync=False):
+    google_service = GoogleCalendarService()
+    results = []
+    try:
+        users = User.objects.in_bulk(user_ids)
+        for user in (users[user_id] for user_id in user_ids if user_id in users):
+            result = {'user_id': user.id, 'events': 0, 'failed': [], 'error': None}
+            try:
+                synced, errors = google_service.sync_all_calendars(user, full_sync=full_sync)
+                result['events'] = sum(synced.values())
+                result['failed'] = sorted(errors)
+            except Exception as e:
+                print(f"Error syncing user {user.username}: {e}")
+                result['error'] = str(e)
+            results.append(result)
+    finally:
+        close_old_connections()
+    return results
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.24 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_api', '0003_google_outbox_entry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='calendarevent',
+            index=models.Index(fields=['user', 'start_datetime'], name='event_user_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='calendarevent',
+            index=models.Index(fields=['user', 'calendar_id', 'start_datetime'], name='event_user_cal_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='calendarevent',
+            index=models.Index(fields=['user', 'end_datetime'], name='event_user_end_idx'),
+        ),
+    ]
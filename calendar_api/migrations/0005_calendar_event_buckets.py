@@ -0,0 +1,53 @@
+# Generated by Django 4.2.24 on 2026-10-18 17:06
+
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def week_bucket(value):
+    day = value.astimezone(datetime.timezone.utc).date()
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def backfill_buckets(apps, schema_editor):
+    CalendarEvent = apps.get_model('calendar_api', 'CalendarEvent')
+    CalendarEventBucket = apps.get_model('calendar_api', 'CalendarEventBucket')
+
+    buckets = []
+    for event in CalendarEvent.objects.only('id', 'user_id', 'start_datetime', 'end_datetime').iterator():
+        bucket = week_bucket(event.start_datetime)
+        last = week_bucket(max(event.start_datetime, event.end_datetime))
+        while bucket <= last:
+            buckets.append(CalendarEventBucket(event_id=event.id, user_id=event.user_id, bucket=bucket))
+            bucket += datetime.timedelta(days=7)
+        if len(buckets) >= 1000:
+            CalendarEventBucket.objects.bulk_create(buckets)
+            buckets = []
+    CalendarEventBucket.objects.bulk_create(buckets)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('calendar_api', '0004_calendar_event_range_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarEventBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateField()),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='calendar_api.calendarevent')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'bucket', 'event'], name='event_bucket_user_idx')],
+                'unique_together': {('event', 'bucket')},
+            },
+        ),
+        migrations.RunPython(backfill_buckets, migrations.RunPython.noop),
+    ]
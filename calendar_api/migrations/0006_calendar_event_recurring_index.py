@@ -0,0 +1,17 @@
+# Generated by Django 4.2.24 on 2026-10-18 17:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_api', '0005_calendar_event_buckets'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='calendarevent',
+            index=models.Index(condition=models.Q(('recurrence_rule__gt', '')), fields=['user', 'start_datetime'], name='event_user_recurring_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.24 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_api', '0006_calendar_event_recurring_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='calendarevent',
+            index=models.Index(fields=['user', 'updated_at', 'last_synced_at'], name='event_user_updated_idx'),
+        ),
+    ]
@@ -1,6 +1,38 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from datetime import timedelta, timezone as dt_timezone
+
+
+def week_bucket(value):
+    # Monday (UTC) of the week containing ``value``.
+    day = value.astimezone(dt_timezone.utc).date()
+    return day - timedelta(days=day.weekday())
+
+
+class CalendarEventQuerySet(models.QuerySet):
+    def overlapping(self, user, start, end):
+        return self.overlapping_for_users([user], start, end)
+    
+    def overlapping_for_users(self, users, start, end):
+        # Events overlapping [start, end). The bucket table narrows the
+        # candidates to events touching the window's weeks, so events that
+        # started long before the window are found without scanning
+        # everything before it. The ids come from a subquery, so the window's
+        # events never round-trip through Python or hit the database's bound
+        # parameter limit, and the users are implied by them; avoid chaining
+        # this onto a user filter, which would let the planner walk the
+        # (user, start) index instead.
+        event_ids = CalendarEventBucket.objects.filter(
+            user__in=users,
+            bucket__range=(week_bucket(start), week_bucket(end))
+        ).values('event_id')
+        return self.filter(
+            pk__in=event_ids,
+            start_datetime__lt=end,
+            end_datetime__gt=start
+        )
+
 
 class CalendarEvent(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='calendar_events')
@@ -19,8 +51,25 @@ class CalendarEvent(models.Model):
     synced_with_google = models.BooleanField(default=False)
     last_synced_at = models.DateTimeField(null=True, blank=True)
     
+    objects = CalendarEventQuerySet.as_manager()
+    
     class Meta:
         ordering = ['start_datetime']
+        indexes = [
+            # Range queries on a user's events, ordered by start.
+            models.Index(fields=['user', 'start_datetime'], name='event_user_start_idx'),
+            models.Index(fields=['user', 'calendar_id', 'start_datetime'], name='event_user_cal_start_idx'),
+            # The other bound of range overlap queries.
+            models.Index(fields=['user', 'end_datetime'], name='event_user_end_idx'),
+            # Covers the count/max aggregates behind the listing ETag.
+            models.Index(fields=['user', 'updated_at', 'last_synced_at'], name='event_user_updated_idx'),
+            # Recurring events, expanded in Python for range listings.
+            models.Index(
+                fields=['user', 'start_datetime'],
+                condition=models.Q(recurrence_rule__gt=''),
+                name='event_user_recurring_idx'
+            ),
+        ]
         
     def __str__(self):
         return f"{self.title} - {self.start_datetime.strftime('%Y-%m-%d %H:%M')}"
@@ -29,3 +78,133 @@ class CalendarEvent(models.Model):
         if self.pk and self.synced_with_google:
             self.last_synced_at = timezone.now()
         super().save(*args, **kwargs)
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'start_datetime', 'end_datetime'} & set(update_fields):
+            CalendarEventBucket.rebuild_for([self])
+
+
+class CalendarEventBucket(models.Model):
+    # One row per week an event touches; kept in sync by CalendarEvent.save
+    # and by rebuild_for() on bulk write paths.
+    event = models.ForeignKey(CalendarEvent, on_delete=models.CASCADE, related_name='buckets')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    bucket = models.DateField()
+    
+    class Meta:
+        unique_together = ['event', 'bucket']
+        indexes = [
+            models.Index(fields=['user', 'bucket', 'event'], name='event_bucket_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_id} @ {self.bucket}"
+    
+    @classmethod
+    def rebuild_for(cls, events):
+        events = [event for event in events if event.pk]
+        if not events:
+            return
+        
+        cls.objects.filter(event__in=events).delete()
+        cls.objects.bulk_create(
+            [
+                cls(event_id=event.pk, user_id=event.user_id, bucket=bucket)
+                for event in events
+                for bucket in cls.buckets_for(event.start_datetime, event.end_datetime)
+            ],
+            batch_size=1000
+        )
+    
+    @staticmethod
+    def buckets_for(start, end):
+        bucket = week_bucket(start)
+        last = week_bucket(max(start, end))
+        while bucket <= last:
+            yield bucket
+            bucket += timedelta(days=7)
+
+
+class GoogleSyncState(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='google_sync_states')
+    calendar_id = models.CharField(max_length=255, default='primary')
+    sync_token = models.TextField(blank=True, null=True)
+    last_full_sync_at = models.DateTimeField(null=True, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['user', 'calendar_id']
+
+    def __str__(self):
+        return f"Sync state for {self.user.username} - {self.calendar_id}"
+
+
+class GoogleOutboxEntry(models.Model):
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    OPERATION_CHOICES = [
+        (CREATE, 'Create'),
+        (UPDATE, 'Update'),
+        (DELETE, 'Delete'),
+    ]
+    
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='google_outbox_entries')
+    # Kept after the local row is deleted so the delete can still be pushed.
+    event = models.ForeignKey(
+        CalendarEvent, on_delete=models.SET_NULL, null=True, blank=True, related_name='outbox_entries'
+    )
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    google_event_id = models.CharField(max_length=255, blank=True, null=True)
+    calendar_id = models.CharField(max_length=255, default='primary')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True, null=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.operation} {self.event_id or self.google_event_id} ({self.status})"
+
+
+class GoogleWatchChannel(models.Model):
+    # A Google push-notification channel (events().watch) for one calendar.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='google_watch_channels')
+    calendar_id = models.CharField(max_length=255, default='primary')
+    channel_id = models.CharField(max_length=64, unique=True)
+    resource_id = models.CharField(max_length=255, blank=True, null=True)
+    # Sent back by Google in X-Goog-Channel-Token with every notification.
+    token = models.CharField(max_length=64)
+    expiration = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['expiration']),
+        ]
+    
+    def __str__(self):
+        return f"Watch {self.channel_id} for {self.user.username} - {self.calendar_id}"
@@ -0,0 +1,257 @@
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+from googleapiclient.errors import HttpError
+from .models import CalendarEvent, GoogleOutboxEntry
+from .services import GoogleCalendarService
+import random
+import uuid
+
+
+# Only these are written back, so saving never resurrects an event FK
+# that was nulled while the push was in flight.
+ENTRY_STATE_FIELDS = [
+    'status', 'attempts', 'next_attempt_at', 'locked_by', 'locked_at',
+    'last_error', 'updated_at'
+]
+
+
+class OutboxPushError(Exception):
+    pass
+
+
+def enqueue_event_push(event, operation):
+    entries = enqueue_event_pushes([event], operation)
+    return entries[0] if entries else None
+
+
+def enqueue_event_pushes(events, operation):
+    # Must run inside the transaction that wrote the events so the entries
+    # commit (or roll back) together with the local change.
+    events = list(events)
+    if not events:
+        return []
+    pending = GoogleOutboxEntry.objects.filter(event__in=events, status=GoogleOutboxEntry.PENDING)
+
+    if operation == GoogleOutboxEntry.DELETE:
+        # Anything still queued for the events is moot once they are deleted.
+        pending.delete()
+        events = [event for event in events if event.google_event_id]
+    else:
+        # Pushes read the event when they run, so an already queued entry
+        # will carry this change too.
+        queued = set(pending.values_list('event_id', flat=True))
+        events = [event for event in events if event.pk not in queued]
+
+    return GoogleOutboxEntry.objects.bulk_create([
+        GoogleOutboxEntry(
+            user_id=event.user_id,
+            event=event,
+            operation=operation,
+            google_event_id=event.google_event_id,
+            calendar_id=event.calendar_id,
+        )
+        for event in events
+    ])
+
+
+def claim_due_entries(limit):
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.GOOGLE_OUTBOX_LOCK_TIMEOUT)
+    due = (
+        Q(status=GoogleOutboxEntry.PENDING, next_attempt_at__lte=now) |
+        Q(status=GoogleOutboxEntry.PROCESSING, locked_at__lt=stale)
+    )
+    worker_id = uuid.uuid4().hex
+
+    # The status filter is repeated in the UPDATE so two workers racing for
+    # the same rows cannot both claim them.
+    ids = list(GoogleOutboxEntry.objects.filter(due).values_list('id', flat=True)[:limit])
+    GoogleOutboxEntry.objects.filter(due, id__in=ids).update(
+        status=GoogleOutboxEntry.PROCESSING,
+        locked_by=worker_id,
+        locked_at=now,
+    )
+
+    return list(
+        GoogleOutboxEntry.objects
+        .filter(locked_by=worker_id, status=GoogleOutboxEntry.PROCESSING)
+        .select_related('user', 'event')
+    )
+
+
+def process_entries(entries, google_service=None):
+    # All entries belong to one user. They are pushed as Google batch
+    # requests, never putting two changes to the same event in one batch
+    # since Google does not order the calls inside a batch.
+    google_service = google_service or GoogleCalendarService()
+    pushed = 0
+
+    try:
+        for round_entries in _split_rounds(entries):
+            for i in range(0, len(round_entries), google_service.BATCH_SIZE):
+                pushed += push_batch(round_entries[i:i + google_service.BATCH_SIZE], google_service)
+    finally:
+        # Runs on pool threads, each holding its own DB connection.
+        close_old_connections()
+
+    return pushed
+
+
+def _split_rounds(entries):
+    rounds = []
+    seen = {}
+    for entry in entries:
+        key = entry.event_id or entry.google_event_id
+        index = seen.get(key, 0)
+        seen[key] = index + 1
+        if index == len(rounds):
+            rounds.append([])
+        rounds[index].append(entry)
+    return rounds
+
+
+def push_batch(entries, google_service):
+    pushed = 0
+    operations = []
+    batched = []
+
+    # Re-read the events: an earlier round may have created one on Google
+    # (setting google_event_id) or it may have changed since it was claimed.
+    events = CalendarEvent.objects.in_bulk([entry.event_id for entry in entries if entry.event_id])
+    for entry in entries:
+        entry.event = events.get(entry.event_id)
+
+    for entry in entries:
+        if entry.operation != GoogleOutboxEntry.DELETE and entry.event is None:
+            # Deleted locally after this entry was queued; its delete entry
+            # takes care of Google.
+            mark_entry_done(entry)
+            pushed += 1
+            continue
+        operations.append((str(entry.pk),) + entry_operation(entry, google_service))
+        batched.append(entry)
+
+    if not batched:
+        return pushed
+
+    try:
+        results = google_service.execute_batch(batched[0].user, operations)
+        if results is None:
+            raise OutboxPushError('User not authenticated with Google')
+    except Exception as e:
+        for entry in batched:
+            mark_entry_failed(entry, e)
+        return pushed
+
+    for entry in batched:
+        response, exception = results.get(
+            str(entry.pk), (None, OutboxPushError('No response in batch'))
+        )
+        if _is_already_created(entry, exception):
+            # An earlier attempt inserted it but its response was lost.
+            response, exception = {'id': google_service.google_event_id_for(entry.event)}, None
+        if exception is None or _is_already_deleted(entry, exception):
+            if entry.operation != GoogleOutboxEntry.DELETE:
+                mark_event_synced(entry, response, google_service)
+            mark_entry_done(entry)
+            pushed += 1
+        else:
+            mark_entry_failed(entry, exception)
+
+    return pushed
+
+
+def entry_operation(entry, google_service):
+    if entry.operation == GoogleOutboxEntry.DELETE:
+        return 'delete', {
+            'calendarId': entry.calendar_id,
+            'eventId': entry.google_event_id,
+        }
+
+    event = entry.event
+    body = google_service.google_event_body(event)
+    if event.google_event_id:
+        return 'update', {
+            'calendarId': event.calendar_id,
+            'eventId': event.google_event_id,
+            'body': body,
+        }
+    body['id'] = google_service.google_event_id_for(event)
+    return 'insert', {
+        'calendarId': event.calendar_id,
+        'body': body,
+    }
+
+
+def _is_already_created(entry, exception):
+    return (
+        entry.operation != GoogleOutboxEntry.DELETE and
+        not entry.event.google_event_id and
+        isinstance(exception, HttpError) and
+        exception.resp.status == 409
+    )
+
+
+def _is_already_deleted(entry, exception):
+    return (
+        entry.operation == GoogleOutboxEntry.DELETE and
+        isinstance(exception, HttpError) and
+        exception.resp.status in (404, 410)
+    )
+
+
+def mark_event_synced(entry, google_event, google_service):
+    event = entry.event
+    # Leave the flag off while a newer local change is still queued.
+    has_pending = GoogleOutboxEntry.objects.filter(
+        event=event, status=GoogleOutboxEntry.PENDING
+    ).exclude(pk=entry.pk).exists()
+
+    updated = CalendarEvent.objects.filter(pk=event.pk).update(
+        google_event_id=google_event['id'],
+        synced_with_google=not has_pending,
+        last_synced_at=timezone.now(),
+    )
+
+    if not updated and not event.google_event_id:
+        # The event was deleted while its create was in flight, so no
+        # delete entry was queued for it; undo the create here.
+        try:
+            google_service.delete_event(entry.user, google_event['id'], event.calendar_id)
+        except Exception as e:
+            print(f"Error deleting orphaned Google event {google_event['id']}: {e}")
+
+
+def mark_entry_done(entry):
+    entry.status = GoogleOutboxEntry.DONE
+    entry.attempts += 1
+    entry.locked_by = None
+    entry.locked_at = None
+    entry.last_error = None
+    entry.save(update_fields=ENTRY_STATE_FIELDS)
+
+
+def mark_entry_failed(entry, error):
+    entry.attempts += 1
+    entry.last_error = str(error)
+    entry.locked_by = None
+    entry.locked_at = None
+
+    if entry.attempts >= settings.GOOGLE_OUTBOX_MAX_ATTEMPTS:
+        entry.status = GoogleOutboxEntry.FAILED
+    else:
+        entry.status = GoogleOutboxEntry.PENDING
+        entry.next_attempt_at = timezone.now() + retry_delay(entry.attempts)
+    entry.save(update_fields=ENTRY_STATE_FIELDS)
+
+
+def retry_delay(attempts):
+    delay = min(
+        settings.GOOGLE_OUTBOX_RETRY_BASE * (2 ** (attempts - 1)),
+        settings.GOOGLE_OUTBOX_RETRY_MAX
+    )
+    # Jitter keeps retries of a burst of failures from landing together.
+    return timedelta(seconds=delay * random.uniform(0.5, 1.5))
@@ -0,0 +1,85 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from heapq import merge
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from .serializers import EVENT_ROW_ID, EVENT_ROW_START
+
+
+class EventKeysetPagination(BasePagination):
+    # Keyset pagination on (start_datetime, id): each page continues from
+    # the last row of the previous one, so deep pages cost the same as the
+    # first (no OFFSET).
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None, extra_rows=()):
+        # extra_rows are items computed outside the database (expanded
+        # recurring occurrences), already sorted by (start_datetime, id);
+        # they are merged into the page in position order.
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        if position:
+            start, pk = position
+            # Equivalent to (start_datetime, id) > (start, pk), written so the
+            # start_datetime range can still use the index.
+            queryset = queryset.filter(start_datetime__gte=start).exclude(
+                start_datetime=start, id__lte=pk
+            )
+            extra_rows = [row for row in extra_rows if self.get_position(row) > position]
+
+        page = list(queryset.order_by('start_datetime', 'id')[:self.page_size + 1])
+        if extra_rows:
+            page = list(merge(page, extra_rows[:self.page_size + 1], key=self.get_position))[:self.page_size + 1]
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_position = self.get_position(page[-1]) if self.has_next else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data
+        })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.EVENTS_PAGE_SIZE
+        return max(1, min(page_size, settings.EVENTS_MAX_PAGE_SIZE))
+
+    def get_position(self, item):
+        if isinstance(item, tuple):
+            return item[EVENT_ROW_START], item[EVENT_ROW_ID]
+        return item.start_datetime, item.pk
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def encode_cursor(self, position):
+        start, pk = position
+        return urlsafe_b64encode(f'{start.isoformat()}|{pk}'.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            start, pk = urlsafe_b64decode(encoded.encode()).decode().split('|')
+            start = parse_datetime(start)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if start is None:
+            raise NotFound(self.invalid_cursor_message)
+        return start, pk
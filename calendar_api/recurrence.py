@@ -0,0 +1,101 @@
+from collections import OrderedDict
+from datetime import timezone as dt_timezone
+from dateutil.rrule import rrulestr
+from django.conf import settings
+from .serializers import EVENT_ROW_FIELDS, EVENT_ROW_ID, EVENT_ROW_START
+import threading
+
+EVENT_ROW_END = EVENT_ROW_FIELDS.index('end_datetime')
+EVENT_ROW_RECURRENCE = EVENT_ROW_FIELDS.index('recurrence_rule')
+EVENT_ROW_UPDATED = EVENT_ROW_FIELDS.index('updated_at')
+
+# Expanded occurrence starts per (event id, updated_at, window). Any edit
+# bumps updated_at, so stale expansions are never served; they simply age
+# out of the LRU.
+_occurrence_cache = OrderedDict()
+_occurrence_lock = threading.Lock()
+
+
+def expand_event_rows(rows, window_start, window_end, overlap=False):
+    # Rows from values_list(*EVENT_ROW_FIELDS) for recurring events become
+    # one row per occurrence in the window, with the event's own id and
+    # duration, sorted like the listing by (start_datetime, id).
+    occurrences = []
+    for row in rows:
+        duration = row[EVENT_ROW_END] - row[EVENT_ROW_START]
+        for start in get_occurrences(
+            row[EVENT_ROW_ID], row[EVENT_ROW_UPDATED], row[EVENT_ROW_RECURRENCE],
+            row[EVENT_ROW_START], duration, window_start, window_end, overlap
+        ):
+            values = list(row)
+            values[EVENT_ROW_START] = start
+            values[EVENT_ROW_END] = start + duration
+            occurrences.append(tuple(values))
+
+    occurrences.sort(key=lambda row: (row[EVENT_ROW_START], row[EVENT_ROW_ID]))
+    return occurrences
+
+
+def get_occurrences(event_id, updated_at, recurrence_rule, start, duration, window_start, window_end, overlap=False):
+    key = (event_id, updated_at, window_start, window_end, overlap)
+
+    with _occurrence_lock:
+        cached = _occurrence_cache.get(key)
+        if cached is not None:
+            _occurrence_cache.move_to_end(key)
+            return cached
+
+    occurrences = expand_rule(recurrence_rule, start, duration, window_start, window_end, overlap)
+
+    with _occurrence_lock:
+        _occurrence_cache[key] = occurrences
+        _occurrence_cache.move_to_end(key)
+        while len(_occurrence_cache) > settings.RECURRENCE_CACHE_SIZE:
+            _occurrence_cache.popitem(last=False)
+    return occurrences
+
+
+def clear_occurrence_cache():
+    with _occurrence_lock:
+        _occurrence_cache.clear()
+
+
+def expand_rule(recurrence_rule, start, duration, window_start, window_end, overlap=False):
+    # Same window semantics as the listing filters: occurrences overlapping
+    # [window_start, window_end) in overlap mode, otherwise occurrences
+    # starting within [window_start, window_end].
+    #
+    # Stored datetimes are UTC, so the rule is expanded in naive UTC and
+    # UNTIL/EXDATE values are read as UTC too; this keeps Google's date-only
+    # UNTIL values from being rejected against an aware DTSTART.
+    dtstart = _naive_utc(start)
+    try:
+        ruleset = rrulestr(recurrence_rule, dtstart=dtstart, forceset=True, ignoretz=True)
+        after = window_start - duration if overlap else window_start
+        candidates = ruleset.xafter(_naive_utc(after), inc=True)
+    except (ValueError, TypeError) as e:
+        # An unparseable rule still shows the event itself.
+        print(f"Error expanding recurrence rule {recurrence_rule!r}: {e}")
+        candidates = [dtstart]
+
+    occurrences = []
+    for occurrence in candidates:
+        occurrence = occurrence.replace(tzinfo=dt_timezone.utc)
+        if overlap:
+            if occurrence >= window_end:
+                break
+            if occurrence + duration <= window_start:
+                continue
+        else:
+            if occurrence > window_end:
+                break
+            if occurrence < window_start:
+                continue
+        occurrences.append(occurrence)
+        if len(occurrences) >= settings.RECURRENCE_MAX_OCCURRENCES:
+            break
+    return occurrences
+
+
+def _naive_utc(value):
+    return value.astimezone(dt_timezone.utc).replace(tzinfo=None)
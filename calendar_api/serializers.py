@@ -1,3 +1,6 @@
+from django.db import models
+from django.utils import timezone
+from datetime import timezone as dt_timezone
 from rest_framework import serializers
 from .models import CalendarEvent
 from users.serializers import UserSerializer
@@ -18,10 +21,79 @@ class CalendarEventSerializer(serializers.ModelSerializer):
             'synced_with_google', 'last_synced_at'
         ]
 
+class CalendarEventListSerializer(CalendarEventSerializer):
+    # Listings only hold the requesting user's events; the user is sent once
+    # in the response envelope and each event refers to it by id, which is
+    # read from user_id without loading the row.
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+
+# Read-only fast path for listings: rows from values_list(*EVENT_ROW_FIELDS)
+# are turned into the same dicts CalendarEventListSerializer produces,
+# without per-field serializer dispatch.
+EVENT_ROW_KEYS = tuple(CalendarEventListSerializer.Meta.fields)
+EVENT_ROW_FIELDS = tuple('user_id' if key == 'user' else key for key in EVENT_ROW_KEYS)
+EVENT_ROW_START = EVENT_ROW_FIELDS.index('start_datetime')
+EVENT_ROW_ID = EVENT_ROW_FIELDS.index('id')
+_EVENT_ROW_DATETIMES = tuple(
+    index for index, name in enumerate(EVENT_ROW_FIELDS)
+    if isinstance(CalendarEvent._meta.get_field(name), models.DateTimeField)
+)
+
+def serialize_event_rows(rows):
+    current_timezone = timezone.get_current_timezone()
+    # Values already in UTC need no conversion when UTC is also the output zone.
+    utc_output = timezone.get_current_timezone_name() == 'UTC'
+    keys = EVENT_ROW_KEYS
+    datetime_positions = _EVENT_ROW_DATETIMES
+    data = []
+    
+    for row in rows:
+        values = list(row)
+        for index in datetime_positions:
+            value = values[index]
+            if value is None:
+                continue
+            if not (utc_output and value.tzinfo is dt_timezone.utc):
+                value = value.astimezone(current_timezone)
+            # Same output as DRF's DateTimeField in ISO 8601 mode.
+            value = value.isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            values[index] = value
+        data.append(dict(zip(keys, values)))
+    
+    return data
+
 class CalendarEventCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = CalendarEvent
         fields = [
             'title', 'description', 'start_datetime', 'end_datetime',
             'location', 'is_all_day', 'recurrence_rule', 'calendar_id'
-        ]
\ No newline at end of file
+        ]
+
+class BulkEventOperationSerializer(serializers.Serializer):
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    
+    op = serializers.ChoiceField(choices=[CREATE, UPDATE, DELETE])
+    id = serializers.IntegerField(required=False)
+    data = serializers.DictField(required=False)
+    
+    def validate(self, attrs):
+        op = attrs['op']
+        if op != self.DELETE and 'data' not in attrs:
+            raise serializers.ValidationError({'data': f'This field is required for {op}.'})
+        if op != self.CREATE and 'id' not in attrs:
+            raise serializers.ValidationError({'id': f'This field is required for {op}.'})
+        
+        if op != self.DELETE:
+            event_serializer = CalendarEventCreateSerializer(
+                data=attrs['data'], partial=(op == self.UPDATE)
+            )
+            if not event_serializer.is_valid():
+                raise serializers.ValidationError({'data': event_serializer.errors})
+            attrs['data'] = event_serializer.validated_data
+        
+        return attrs
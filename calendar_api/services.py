@@ -1,14 +1,57 @@
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from google_auth_oauthlib.flow import Flow
 from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Q
 from django.utils import timezone
-from datetime import datetime, timedelta
-from .models import CalendarEvent
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+from .models import CalendarEvent, CalendarEventBucket, GoogleOutboxEntry, GoogleSyncState
+from . import google_api
 import json
+import queue
+import threading
+import time
+import uuid
+
+# Credentials per user id (LRU, GOOGLE_SERVICE_CACHE_SIZE users), so request
+# paths skip the GoogleOAuthToken lookup. Dropped whenever
+# save_credentials_to_user stores new tokens.
+_credentials_cache = OrderedDict()
+_credentials_lock = threading.Lock()
+
+# Striped locks serialising token refreshes within the process: a user
+# always maps to the same lock, and the set never grows.
+_refresh_locks = [threading.Lock() for _ in range(64)]
+
+def _get_refresh_lock(user_id):
+    return _refresh_locks[hash(user_id) % len(_refresh_locks)]
+
+def is_invalid_grant(error):
+    # google-auth passes the token endpoint's JSON error as the second arg.
+    details = error.args[1] if len(error.args) > 1 else None
+    return isinstance(details, dict) and details.get('error') == 'invalid_grant'
 
 class GoogleCalendarService:
     SCOPES = ['https://www.googleapis.com/auth/calendar']
+    # Largest page events().list will return.
+    MAX_PAGE_SIZE = 2500
+    # Google caps Calendar batch requests at 50 calls.
+    BATCH_SIZE = 50
+    # Rows per prefetch/bulk write when applying synced events.
+    SYNC_BATCH_SIZE = 500
+    # Seconds between re-reads while another process refreshes a token.
+    REFRESH_POLL_INTERVAL = 0.05
+    SYNCED_FIELDS = [
+        'title', 'description', 'start_datetime', 'end_datetime',
+        'location', 'is_all_day', 'calendar_id', 'status'
+    ]
     
     def __init__(self, user=None):
         self.user = user
@@ -41,31 +84,107 @@ class GoogleCalendarService:
         return flow.credentials
     
     def get_credentials_from_user(self, user):
+        with _credentials_lock:
+            credentials = _credentials_cache.get(user.id)
+            if credentials is not None:
+                _credentials_cache.move_to_end(user.id)
+        # An expired entry may already have been refreshed by another
+        # process (e.g. refresh_google_tokens), so re-read the row first.
+        if credentials is not None and not credentials.expired:
+            return credentials
+        
         try:
-            google_token = user.google_token
-            credentials = Credentials(
-                token=google_token.access_token,
-                refresh_token=google_token.refresh_token,
-                token_uri="https://oauth2.googleapis.com/token",
-                client_id=settings.GOOGLE_OAUTH2_CLIENT_ID,
-                client_secret=settings.GOOGLE_OAUTH2_CLIENT_SECRET,
-                scopes=self.SCOPES
+            from authentication.models import GoogleOAuthToken
+            credentials = self._build_credentials(
+                GoogleOAuthToken.objects.get(user=user, invalid_at__isnull=True)
             )
-            return credentials
         except:
             return None
+        
+        with _credentials_lock:
+            _credentials_cache[user.id] = credentials
+            _credentials_cache.move_to_end(user.id)
+            while len(_credentials_cache) > settings.GOOGLE_SERVICE_CACHE_SIZE:
+                _credentials_cache.popitem(last=False)
+        return credentials
+    
+    def _build_credentials(self, google_token):
+        return Credentials(
+            token=google_token.access_token,
+            refresh_token=google_token.refresh_token,
+            token_uri="https://oauth2.googleapis.com/token",
+            client_id=settings.GOOGLE_OAUTH2_CLIENT_ID,
+            client_secret=settings.GOOGLE_OAUTH2_CLIENT_SECRET,
+            scopes=self.SCOPES,
+            # google-auth compares expiry against naive UTC.
+            expiry=timezone.make_naive(google_token.expires_at, dt_timezone.utc)
+        )
     
-    def refresh_credentials(self, user):
+    def invalidate_credentials(self, user):
+        with _credentials_lock:
+            _credentials_cache.pop(user.id, None)
+        # Services are bound to the old credentials; drop them too, so
+        # revoked tokens do not linger in the service cache.
+        google_api.evict_user_services(user.id)
+    
+    def refresh_credentials(self, user, force=False):
+        from authentication.models import GoogleOAuthToken
+        
         credentials = self.get_credentials_from_user(user)
-        if credentials and credentials.expired:
-            credentials.refresh()
+        if not credentials or not (force or credentials.expired):
+            return credentials
+        
+        # Single flight: concurrent callers for the same user wait here for
+        # the first refresh instead of each hitting the token endpoint. The
+        # lock covers this process; across processes the first to claim the
+        # row's refreshing_until lease refreshes and the rest poll the row
+        # until it has saved the new token. A conditional UPDATE works on
+        # every backend, SQLite included, which ignores SELECT FOR UPDATE.
+        stale_token = credentials.token
+        with _get_refresh_lock(user.id):
+            while True:
+                # Re-read the row rather than the cache so a refresh saved
+                # by another process is picked up too.
+                try:
+                    google_token = GoogleOAuthToken.objects.get(user=user, invalid_at__isnull=True)
+                except GoogleOAuthToken.DoesNotExist:
+                    return None
+                if google_token.access_token != stale_token and not google_token.is_expired():
+                    self.invalidate_credentials(user)
+                    return self.get_credentials_from_user(user)
+                
+                now = timezone.now()
+                claimed = GoogleOAuthToken.objects.filter(
+                    Q(refreshing_until__isnull=True) | Q(refreshing_until__lt=now),
+                    pk=google_token.pk, access_token=google_token.access_token,
+                ).update(refreshing_until=now + timedelta(seconds=settings.GOOGLE_TOKEN_REFRESH_LEASE))
+                if claimed:
+                    break
+                time.sleep(self.REFRESH_POLL_INTERVAL)
+            
+            # The token endpoint is called outside any transaction so no
+            # database lock is held while waiting on Google.
+            credentials = self._build_credentials(google_token)
+            try:
+                credentials.refresh(Request())
+            except Exception as e:
+                released = {'refreshing_until': None}
+                if isinstance(e, RefreshError) and is_invalid_grant(e):
+                    # Retrying cannot help until the user reconnects.
+                    released['invalid_at'] = timezone.now()
+                GoogleOAuthToken.objects.filter(pk=google_token.pk).update(**released)
+                self.invalidate_credentials(user)
+                raise
             self.save_credentials_to_user(user, credentials)
         return credentials
     
     def save_credentials_to_user(self, user, credentials):
         from authentication.models import GoogleOAuthToken
         
-        expires_at = timezone.now() + timedelta(seconds=credentials.expiry.timestamp() - timezone.now().timestamp())
+        if credentials.expiry:
+            expires_at = timezone.make_aware(credentials.expiry, dt_timezone.utc)
+        else:
+            expires_at = timezone.now() + timedelta(hours=1)
         
         token, created = GoogleOAuthToken.objects.get_or_create(
             user=user,
@@ -84,7 +203,11 @@ class GoogleCalendarService:
             if credentials.refresh_token:
                 token.refresh_token = credentials.refresh_token
             token.expires_at = expires_at
+            token.invalid_at = None
+            token.refreshing_until = None
             token.save()
+        
+        self.invalidate_credentials(user)
             
         return token
     
@@ -96,39 +219,113 @@ class GoogleCalendarService:
         if credentials.expired:
             credentials = self.refresh_credentials(user)
             
-        service = build('calendar', 'v3', credentials=credentials)
-        return service
+        return google_api.get_user_service(user.id, credentials)
+    
+    def get_calendar_list(self, user, refresh=False):
+        # Cached per user. Past GOOGLE_CALENDAR_LIST_TTL the cached list is
+        # still returned, and refreshed from Google in the background.
+        cached = None if refresh else cache.get(self._calendar_list_key(user))
+        if cached is None:
+            return self._fetch_calendar_list(user)
+        
+        if time.time() - cached['fetched_at'] >= settings.GOOGLE_CALENDAR_LIST_TTL:
+            self._revalidate_calendar_list(user)
+        return cached['calendar_list']
+    
+    def invalidate_calendar_list(self, user):
+        cache.delete(self._calendar_list_key(user))
     
-    def list_events(self, user, calendar_id='primary', max_results=100, time_min=None, time_max=None):
+    def _calendar_list_key(self, user):
+        return f'google-calendar-list:{user.id}'
+    
+    def _fetch_calendar_list(self, user):
         service = self.get_calendar_service(user)
         if not service:
-            return []
+            return None
+        
+        calendar_list = google_api.execute(service.calendarList().list(), user_id=user.id)
+        cache.set(
+            self._calendar_list_key(user),
+            {'calendar_list': calendar_list, 'fetched_at': time.time()},
+            timeout=settings.GOOGLE_CALENDAR_LIST_TTL + settings.GOOGLE_CALENDAR_LIST_STALE
+        )
+        return calendar_list
+    
+    def _revalidate_calendar_list(self, user):
+        # cache.add only succeeds for the first caller, so a burst of
+        # requests on a stale entry starts a single refresh.
+        if not cache.add(self._calendar_list_key(user) + ':refreshing', True, timeout=60):
+            return
+        threading.Thread(target=self._refresh_calendar_list, args=(user,), daemon=True).start()
+    
+    def _refresh_calendar_list(self, user):
+        try:
+            self._fetch_calendar_list(user)
+        except Exception as e:
+            print(f"Error refreshing calendar list for user {user.id}: {e}")
+        finally:
+            cache.delete(self._calendar_list_key(user) + ':refreshing')
+            close_old_connections()
+    
+    def list_events(self, user, calendar_id='primary', max_results=None, time_min=None, time_max=None):
+        events = self.iter_events(user, calendar_id=calendar_id, time_min=time_min, time_max=time_max)
+        if max_results:
+            return list(islice(events, max_results))
+        return list(events)
+    
+    def iter_events(self, user, calendar_id='primary', time_min=None, time_max=None):
+        service = self.get_calendar_service(user)
+        if not service:
+            return
             
         if not time_min:
             time_min = timezone.now().isoformat()
         if not time_max:
             time_max = (timezone.now() + timedelta(days=30)).isoformat()
-            
-        events_result = service.events().list(
+        
+        for page in self._iter_event_pages(
+            service,
+            user_id=user.id,
             calendarId=calendar_id,
             timeMin=time_min,
             timeMax=time_max,
-            maxResults=max_results,
             singleEvents=True,
             orderBy='startTime'
-        ).execute()
-        
-        return events_result.get('items', [])
+        ):
+            yield from page.get('items', [])
+    
+    def _iter_event_pages(self, service, http=None, user_id=None, **params):
+        params['maxResults'] = self.MAX_PAGE_SIZE
+        page_token = None
+        while True:
+            if page_token:
+                params['pageToken'] = page_token
+            page = google_api.execute(service.events().list(**params), http=http, user_id=user_id)
+            yield page
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return
     
     def create_event(self, user, event_data):
         service = self.get_calendar_service(user)
         if not service:
             return None
             
-        event = service.events().insert(
-            calendarId=event_data.get('calendar_id', 'primary'),
-            body=self._format_event_for_google(event_data)
-        ).execute()
+        # The id is chosen here so a retried insert cannot create a second
+        # copy: Google answers 409 if the first attempt already went through.
+        calendar_id = event_data.get('calendar_id', 'primary')
+        body = self._format_event_for_google(event_data)
+        body['id'] = event_data.get('google_event_id') or uuid.uuid4().hex
+        try:
+            event = google_api.execute(
+                service.events().insert(calendarId=calendar_id, body=body), user_id=user.id
+            )
+        except HttpError as e:
+            if e.resp.status != 409:
+                raise
+            event = google_api.execute(
+                service.events().get(calendarId=calendar_id, eventId=body['id']), user_id=user.id
+            )
         
         return event
     
@@ -137,11 +334,11 @@ class GoogleCalendarService:
         if not service:
             return None
             
-        event = service.events().update(
+        event = google_api.execute(service.events().update(
             calendarId=calendar_id,
             eventId=event_id,
             body=self._format_event_for_google(event_data)
-        ).execute()
+        ), user_id=user.id)
         
         return event
     
@@ -151,13 +348,58 @@ class GoogleCalendarService:
             return False
             
         try:
-            service.events().delete(
+            google_api.execute(service.events().delete(
                 calendarId=calendar_id,
                 eventId=event_id
-            ).execute()
-            return True
-        except:
-            return False
+            ), user_id=user.id)
+        except HttpError as e:
+            # Already deleted on Google's side.
+            if e.resp.status not in (404, 410):
+                raise
+        return True
+    
+    def execute_batch(self, user, operations):
+        service = self.get_calendar_service(user)
+        if not service:
+            return None
+        
+        results = {}
+        
+        def collect(request_id, response, exception):
+            results[request_id] = (response, exception)
+        
+        # operations are (request_id, events() method name, kwargs) tuples;
+        # results map each request_id to (response, exception).
+        for i in range(0, len(operations), self.BATCH_SIZE):
+            chunk = operations[i:i + self.BATCH_SIZE]
+            batch = service.new_batch_http_request(callback=collect)
+            for request_id, method, params in chunk:
+                batch.add(getattr(service.events(), method)(**params), request_id=request_id)
+            # Each call in the batch counts against the quota.
+            google_api.execute(batch, user_id=user.id, cost=len(chunk))
+        
+        return results
+    
+    def google_event_id_for(self, event):
+        # Stable for a local event, so every push of its insert (outbox
+        # retries included) asks Google for the same id. Google ids are
+        # base32hex, which hex digits satisfy.
+        return uuid.uuid5(uuid.NAMESPACE_URL, f'calendar-event:{event.pk}:{event.created_at.isoformat()}').hex
+    
+    def google_event_body(self, event):
+        return self._format_event_for_google(self.event_data_from_model(event))
+    
+    def event_data_from_model(self, event):
+        return {
+            'title': event.title,
+            'description': event.description,
+            'start_datetime': event.start_datetime,
+            'end_datetime': event.end_datetime,
+            'location': event.location,
+            'is_all_day': event.is_all_day,
+            'calendar_id': event.calendar_id,
+            'recurrence_rule': event.recurrence_rule,
+        }
     
     def _format_event_for_google(self, event_data):
         google_event = {
@@ -184,41 +426,298 @@ class GoogleCalendarService:
             }
         
         if event_data.get('recurrence_rule'):
-            google_event['recurrence'] = [event_data['recurrence_rule']]
+            # One RRULE/EXDATE/RDATE line per entry, e.g. from an .ics import.
+            google_event['recurrence'] = event_data['recurrence_rule'].splitlines()
             
         return google_event
     
-    def sync_events_from_google(self, user):
-        google_events = self.list_events(user)
+    def sync_events_from_google(self, user, calendar_id='primary', full_sync=False):
+        service = self.get_calendar_service(user)
+        if not service:
+            return []
+        
+        sync_state, _ = GoogleSyncState.objects.get_or_create(user=user, calendar_id=calendar_id)
+        if full_sync:
+            sync_state.sync_token = None
+        
         synced_events = []
+        next_sync_token = None
+        
+        try:
+            # Pages are applied as they arrive so a large calendar is never
+            # held in memory all at once.
+            for page in self._iter_event_pages(
+                service, user_id=user.id, **self._event_sync_params(calendar_id, sync_state.sync_token)
+            ):
+                synced_events.extend(
+                    self._apply_google_events(user, calendar_id, page.get('items', []))
+                )
+                # nextSyncToken is only present on the last page.
+                next_sync_token = page.get('nextSyncToken')
+        except HttpError as e:
+            # Google expires sync tokens at will and answers 410 Gone; the
+            # only way forward is to drop the token and list everything again.
+            if e.resp.status == 410 and sync_state.sync_token:
+                sync_state.sync_token = None
+                sync_state.save()
+                return self.sync_events_from_google(user, calendar_id, full_sync=True)
+            raise
+        
+        self._finish_sync(sync_state, next_sync_token)
+        return synced_events
+    
+    def sync_all_calendars(self, user, full_sync=False):
+        # Every calendar in the user's list is fetched concurrently, each
+        # pool thread with its own transport; pages come back through a
+        # queue and are written by this thread only, so the DB sees one
+        # writer. Returns ({calendar id: synced count}, {calendar id: error}).
+        calendar_list = self.get_calendar_list(user)
+        service = self.get_calendar_service(user)
+        if calendar_list is None or not service:
+            return {}, {}
+        credentials = self.get_credentials_from_user(user)
+        
+        # Free/busy-only calendars cannot list events.
+        calendar_ids = [
+            calendar['id'] for calendar in calendar_list.get('items', [])
+            if calendar.get('accessRole') != 'freeBusyReader'
+        ]
+        sync_states = {}
+        for calendar_id in calendar_ids:
+            sync_state, _ = GoogleSyncState.objects.get_or_create(user=user, calendar_id=calendar_id)
+            if full_sync:
+                sync_state.sync_token = None
+            sync_states[calendar_id] = sync_state
+        
+        synced = dict.fromkeys(calendar_ids, 0)
+        errors = {}
+        next_sync_tokens = {}
+        workers = max(1, min(settings.GOOGLE_SYNC_WORKERS, len(calendar_ids)))
+        # Bounded, so fetching never runs far ahead of the writer.
+        pages = queue.Queue(maxsize=workers * 2)
+        stop = threading.Event()
+        
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(self._fetch_calendar_pages, service, credentials, user.id, calendar_id,
+                            sync_states[calendar_id].sync_token, pages, stop)
+                for calendar_id in calendar_ids
+            ]
+            running = len(futures)
+            try:
+                while running:
+                    calendar_id, page, error = pages.get()
+                    if page is not None:
+                        synced[calendar_id] += len(
+                            self._apply_google_events(user, calendar_id, page.get('items', []))
+                        )
+                        if page.get('nextSyncToken'):
+                            next_sync_tokens[calendar_id] = page['nextSyncToken']
+                        continue
+                    
+                    sync_state = sync_states[calendar_id]
+                    if error is None:
+                        self._finish_sync(sync_state, next_sync_tokens.get(calendar_id))
+                    elif isinstance(error, HttpError) and error.resp.status == 410 and sync_state.sync_token:
+                        # Expired sync token: list this calendar again from scratch.
+                        sync_state.sync_token = None
+                        sync_state.save()
+                        futures.append(pool.submit(
+                            self._fetch_calendar_pages, service, credentials, user.id, calendar_id, None, pages, stop
+                        ))
+                        continue
+                    else:
+                        print(f"Error syncing calendar {calendar_id} for user {user.id}: {error}")
+                        errors[calendar_id] = error
+                    running -= 1
+            finally:
+                # Unblock workers still waiting on a full queue if this
+                # thread stopped early.
+                stop.set()
+                while not all(future.done() for future in futures):
+                    try:
+                        pages.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+        
+        return synced, errors
+    
+    def _fetch_calendar_pages(self, service, credentials, user_id, calendar_id, sync_token, pages, stop):
+        # Runs on a pool thread, with its own authorized client drawing
+        # connections from the shared keep-alive pool.
+        http = self._worker_http(credentials)
+        try:
+            for page in self._iter_event_pages(
+                service, http=http, user_id=user_id, **self._event_sync_params(calendar_id, sync_token)
+            ):
+                if stop.is_set():
+                    return
+                pages.put((calendar_id, page, None))
+            pages.put((calendar_id, None, None))
+        except Exception as e:
+            pages.put((calendar_id, None, e))
+    
+    def _worker_http(self, credentials):
+        return google_api.authorized_http(credentials)
+    
+    def _finish_sync(self, sync_state, next_sync_token):
+        now = timezone.now()
+        if not sync_state.sync_token:
+            sync_state.last_full_sync_at = now
+        sync_state.sync_token = next_sync_token
+        sync_state.last_synced_at = now
+        sync_state.save()
+    
+    def _event_sync_params(self, calendar_id, sync_token=None):
+        if sync_token:
+            # timeMin/timeMax/orderBy are rejected alongside a syncToken;
+            # the token already remembers the window of the full sync.
+            return {
+                'calendarId': calendar_id,
+                'syncToken': sync_token,
+                'singleEvents': True,
+            }
+        return {
+            'calendarId': calendar_id,
+            'timeMin': timezone.now().isoformat(),
+            'timeMax': (timezone.now() + timedelta(days=settings.GOOGLE_SYNC_WINDOW_DAYS)).isoformat(),
+            'singleEvents': True,
+        }
+    
+    def _apply_google_events(self, user, calendar_id, google_events):
+        incoming = {}
+        cancelled_ids = []
         
         for google_event in google_events:
             try:
-                start_dt = self._parse_google_datetime(google_event['start'])
-                end_dt = self._parse_google_datetime(google_event['end'])
-                
-                event, created = CalendarEvent.objects.update_or_create(
-                    google_event_id=google_event['id'],
-                    user=user,
-                    defaults={
-                        'title': google_event.get('summary', 'No Title'),
-                        'description': google_event.get('description', ''),
-                        'start_datetime': start_dt,
-                        'end_datetime': end_dt,
-                        'location': google_event.get('location', ''),
-                        'is_all_day': 'date' in google_event['start'],
-                        'status': google_event.get('status', 'confirmed'),
-                        'synced_with_google': True,
-                        'last_synced_at': timezone.now()
-                    }
-                )
-                synced_events.append(event)
+                if google_event.get('status') == 'cancelled':
+                    cancelled_ids.append(google_event['id'])
+                    continue
+                incoming[google_event['id']] = self._google_event_fields(google_event, calendar_id)
             except Exception as e:
                 print(f"Error syncing event {google_event.get('id')}: {e}")
                 continue
+        
+        # Syncs use singleEvents, so a recurring event pushed from here comes
+        # back as one event per instance. The local master's rule already
+        # lists those occurrences, so the instances are not stored (and any
+        # stored by earlier syncs are removed).
+        recurring_ids = {
+            google_event['recurringEventId'] for google_event in google_events
+            if google_event.get('recurringEventId')
+        }
+        if recurring_ids:
+            masters = set(CalendarEvent.objects.filter(
+                user=user, google_event_id__in=recurring_ids, recurrence_rule__gt=''
+            ).values_list('google_event_id', flat=True))
+            instance_ids = [
+                google_event['id'] for google_event in google_events
+                if google_event.get('recurringEventId') in masters
+            ]
+            for google_event_id in instance_ids:
+                incoming.pop(google_event_id, None)
+            cancelled_ids.extend(instance_ids)
+        
+        synced_events = []
+        google_ids = list(incoming)
+        
+        with transaction.atomic():
+            if cancelled_ids:
+                CalendarEvent.objects.filter(
+                    user=user, google_event_id__in=cancelled_ids
+                ).delete()
+            
+            for i in range(0, len(google_ids), self.SYNC_BATCH_SIZE):
+                chunk = google_ids[i:i + self.SYNC_BATCH_SIZE]
+                synced_events.extend(
+                    self._upsert_google_events(user, {gid: incoming[gid] for gid in chunk})
+                )
                 
         return synced_events
     
+    def _upsert_google_events(self, user, incoming):
+        # bulk writes skip CalendarEvent.save, so last_synced_at, updated_at
+        # and the week buckets are maintained here the way save() would.
+        now = timezone.now()
+        existing = CalendarEvent.objects.in_bulk(list(incoming), field_name='google_event_id')
+        existing_ranges = {
+            google_event_id: (event.start_datetime, event.end_datetime)
+            for google_event_id, event in existing.items()
+        }
+        # Rows with local changes not yet pushed keep them; the outbox will
+        # overwrite Google with the local state, not the other way round.
+        unpushed = set(GoogleOutboxEntry.objects.filter(
+            event__in=[event.pk for event in existing.values()],
+            status__in=[GoogleOutboxEntry.PENDING, GoogleOutboxEntry.PROCESSING]
+        ).values_list('event_id', flat=True))
+        
+        to_create = []
+        to_update = []
+        unchanged = []
+        moved = []
+        
+        for google_event_id, fields in incoming.items():
+            event = existing.get(google_event_id)
+            if event is None:
+                to_create.append(CalendarEvent(
+                    user=user,
+                    google_event_id=google_event_id,
+                    synced_with_google=True,
+                    last_synced_at=now,
+                    **fields
+                ))
+                continue
+            
+            if event.user_id != user.id:
+                print(f"Error syncing event {google_event_id}: owned by another user")
+                continue
+            if not event.synced_with_google or event.pk in unpushed:
+                continue
+            
+            changed = False
+            for name, value in fields.items():
+                if getattr(event, name) != value:
+                    setattr(event, name, value)
+                    changed = True
+            if changed and (event.start_datetime, event.end_datetime) != (
+                existing_ranges[google_event_id]
+            ):
+                moved.append(event)
+            event.last_synced_at = now
+            
+            if changed:
+                event.updated_at = now
+                to_update.append(event)
+            else:
+                unchanged.append(event)
+        
+        if to_create:
+            CalendarEvent.objects.bulk_create(to_create)
+        if to_update:
+            CalendarEvent.objects.bulk_update(
+                to_update,
+                self.SYNCED_FIELDS + ['last_synced_at', 'updated_at']
+            )
+        CalendarEventBucket.rebuild_for(to_create + moved)
+        if unchanged:
+            CalendarEvent.objects.filter(
+                pk__in=[event.pk for event in unchanged]
+            ).update(last_synced_at=now)
+        
+        return to_create + to_update + unchanged
+    
+    def _google_event_fields(self, google_event, calendar_id):
+        return {
+            'title': google_event.get('summary', 'No Title'),
+            'description': google_event.get('description', ''),
+            'start_datetime': self._parse_google_datetime(google_event['start']),
+            'end_datetime': self._parse_google_datetime(google_event['end']),
+            'location': google_event.get('location', ''),
+            'is_all_day': 'date' in google_event['start'],
+            'calendar_id': calendar_id,
+            'status': google_event.get('status', 'confirmed'),
+        }
+    
     def _parse_google_datetime(self, datetime_obj):
         if 'dateTime' in datetime_obj:
             return datetime.fromisoformat(datetime_obj['dateTime'].replace('Z', '+00:00'))
@@ -1,3 +1,1825 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpMockSequence
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from rest_framework.fields import DateTimeField
+from rest_framework.test import APIClient, APIRequestFactory
+from authentication.models import GoogleOAuthToken
+from authentication.services import AuthenticationService
+from . import google_api
+from .freebusy import busy_intervals
+from .outbox import claim_due_entries, enqueue_event_push, enqueue_event_pushes, process_entries
+from .models import (
+    CalendarEvent, CalendarEventBucket, GoogleOutboxEntry, GoogleSyncState, GoogleWatchChannel, week_bucket
+)
+from .recurrence import clear_occurrence_cache, expand_rule
+from .services import GoogleCalendarService
+from .serializers import CalendarEventListSerializer, EVENT_ROW_FIELDS, serialize_event_rows
+from .views import EventListCreateView
+from .watch import notification_headers, renew_expiring_watches, schedule_sync
 
-# Create your tests here.
+
+class EventRangeQueryPlanTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='planner')
+        other = User.objects.create_user(username='other')
+        start = timezone.now()
+        CalendarEvent.objects.bulk_create([
+            CalendarEvent(
+                user=user,
+                title=f'Event {i}',
+                start_datetime=start + timedelta(hours=i),
+                end_datetime=start + timedelta(hours=i, minutes=30),
+                calendar_id='primary' if i % 2 else 'work',
+            )
+            for user in (self.user, other)
+            for i in range(200)
+        ])
+
+    def get_queryset(self, **params):
+        view = EventListCreateView()
+        view.request = view.initialize_request(APIRequestFactory().get('/api/events/', params))
+        view.request.user = self.user
+        return view.get_queryset()
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('SCAN calendar_api_calendarevent', plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_range_query_uses_user_start_index(self):
+        queryset = self.get_queryset(
+            start=timezone.now().isoformat(),
+            end=(timezone.now() + timedelta(days=3)).isoformat()
+        )
+        self.assertUsesIndex(queryset, 'event_user_start_idx')
+
+    def test_calendar_range_query_uses_covering_index(self):
+        queryset = self.get_queryset(
+            calendar_id='work',
+            start=timezone.now().isoformat(),
+            end=(timezone.now() + timedelta(days=3)).isoformat()
+        )
+        self.assertUsesIndex(queryset, 'event_user_cal_start_idx')
+
+
+class EventOverlapQueryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='overlap')
+        self.long_event = self.create_event('Quarter', datetime(2025, 4, 1), datetime(2025, 7, 1))
+        self.create_event('Inside', datetime(2025, 6, 2, 10), datetime(2025, 6, 2, 11))
+        self.create_event('Before', datetime(2025, 5, 30, 10), datetime(2025, 5, 30, 11))
+        self.create_event('After', datetime(2025, 6, 9, 10), datetime(2025, 6, 9, 11))
+
+    def create_event(self, title, start, end):
+        return CalendarEvent.objects.create(
+            user=self.user,
+            title=title,
+            start_datetime=start.replace(tzinfo=dt_timezone.utc),
+            end_datetime=end.replace(tzinfo=dt_timezone.utc),
+        )
+
+    def overlapping_titles(self, start, end):
+        queryset = CalendarEvent.objects.overlapping(
+            self.user, start.replace(tzinfo=dt_timezone.utc), end.replace(tzinfo=dt_timezone.utc)
+        )
+        return [event.title for event in queryset.order_by('start_datetime')]
+
+    def test_includes_events_that_began_before_the_window(self):
+        self.assertEqual(
+            self.overlapping_titles(datetime(2025, 6, 1), datetime(2025, 6, 8)),
+            ['Quarter', 'Inside']
+        )
+
+    def test_buckets_follow_event_changes(self):
+        self.long_event.end_datetime = datetime(2025, 4, 2, tzinfo=dt_timezone.utc)
+        self.long_event.save()
+
+        self.assertEqual(CalendarEventBucket.objects.filter(event=self.long_event).count(), 1)
+        self.assertEqual(
+            self.overlapping_titles(datetime(2025, 6, 1), datetime(2025, 6, 8)),
+            ['Inside']
+        )
+
+    def test_candidates_are_fetched_by_primary_key(self):
+        # The bucket lookup is a subquery of the one events query.
+        with self.assertNumQueries(0):
+            queryset = CalendarEvent.objects.overlapping(
+                self.user,
+                datetime(2025, 6, 1, tzinfo=dt_timezone.utc),
+                datetime(2025, 6, 8, tzinfo=dt_timezone.utc)
+            )
+        plan = queryset.explain()
+        self.assertIn('PRIMARY KEY', plan)
+        self.assertNotIn('event_user_start_idx', plan)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(queryset), 2)
+
+
+class EventKeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pager')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        start = timezone.now()
+        # Pairs of events share a start time so the id tie-breaker matters.
+        CalendarEvent.objects.bulk_create([
+            CalendarEvent(
+                user=self.user,
+                title=f'Event {i}',
+                start_datetime=start + timedelta(hours=i // 2),
+                end_datetime=start + timedelta(hours=i // 2, minutes=30),
+            )
+            for i in range(25)
+        ])
+
+    def test_walks_every_event_once_in_order(self):
+        seen = []
+        url = '/api/events/?page_size=4'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 4)
+            seen.extend(event['id'] for event in response.data['results'])
+            url = response.data['next']
+
+        expected = list(
+            CalendarEvent.objects.filter(user=self.user)
+            .order_by('start_datetime', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_deep_pages_do_not_use_offset(self):
+        response = self.client.get('/api/events/?page_size=20')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(response.data['next'])
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/events/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class EventListQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='counted')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        start = timezone.now()
+        CalendarEvent.objects.bulk_create([
+            CalendarEvent(
+                user=self.user,
+                title=f'Event {i}',
+                start_datetime=start + timedelta(hours=i),
+                end_datetime=start + timedelta(hours=i, minutes=30),
+            )
+            for i in range(100)
+        ])
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        for page_size in (1, 10, 100):
+            # The ETag aggregate, then the page itself.
+            with self.assertNumQueries(2):
+                response = self.client.get(f'/api/events/?page_size={page_size}')
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_user_is_sent_once_in_the_envelope(self):
+        response = self.client.get('/api/events/?page_size=5')
+        self.assertEqual(response.data['user']['id'], self.user.id)
+        self.assertEqual({event['user'] for event in response.data['results']}, {self.user.id})
+
+
+class BulkEventViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulk')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.start = datetime(2025, 3, 3, 10, tzinfo=dt_timezone.utc)
+        self.events = [
+            CalendarEvent.objects.create(
+                user=self.user, title=f'Event {i}', google_event_id=f'g{i}', synced_with_google=True,
+                start_datetime=self.start, end_datetime=self.start + timedelta(hours=1)
+            )
+            for i in range(2)
+        ]
+
+    def post(self, operations):
+        return self.client.post('/api/events/bulk/', operations, format='json')
+
+    def test_applies_mixed_operations_in_one_transaction(self):
+        moved = (self.start + timedelta(weeks=2)).isoformat()
+        response = self.post([
+            {'op': 'create', 'data': {
+                'title': 'New', 'start_datetime': self.start.isoformat(), 'end_datetime': self.start.isoformat()
+            }},
+            {'op': 'update', 'id': self.events[0].pk, 'data': {'start_datetime': moved, 'end_datetime': moved}},
+            {'op': 'delete', 'id': self.events[1].pk},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created', 'updated', 'deleted'])
+
+        updated = CalendarEvent.objects.get(pk=self.events[0].pk)
+        self.assertFalse(updated.synced_with_google)
+        self.assertEqual(
+            list(updated.buckets.values_list('bucket', flat=True)),
+            [week_bucket(self.start + timedelta(weeks=2))]
+        )
+        self.assertFalse(CalendarEvent.objects.filter(pk=self.events[1].pk).exists())
+        self.assertEqual(
+            sorted(GoogleOutboxEntry.objects.values_list('operation', flat=True)),
+            ['create', 'delete', 'update']
+        )
+
+    def test_invalid_operations_change_nothing(self):
+        response = self.post([
+            {'op': 'delete', 'id': self.events[0].pk},
+            {'op': 'update', 'id': self.events[1].pk},
+            {'op': 'update', 'id': 999999, 'data': {'title': 'Missing'}},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][1], {'data': ['This field is required for update.']})
+        self.assertEqual(CalendarEvent.objects.count(), 2)
+
+        response = self.post([
+            {'op': 'update', 'id': 999999, 'data': {'title': 'Missing'}},
+            {'op': 'delete', 'id': self.events[0].pk},
+            {'op': 'update', 'id': self.events[0].pk, 'data': {'title': 'Twice'}},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0], {'id': 'Event not found.'})
+        self.assertEqual(response.data['errors'][2], {'id': 'Event appears in more than one operation.'})
+        self.assertEqual(CalendarEvent.objects.count(), 2)
+        self.assertFalse(GoogleOutboxEntry.objects.exists())
+
+    def test_other_users_events_are_not_found(self):
+        other = User.objects.create_user(username='other')
+        event = CalendarEvent.objects.create(
+            user=other, title='Private', start_datetime=self.start, end_datetime=self.start
+        )
+        response = self.post([{'op': 'delete', 'id': event.pk}])
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(CalendarEvent.objects.filter(pk=event.pk).exists())
+
+
+class EventRowSerializerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rows')
+        start = timezone.now().replace(microsecond=123456)
+        CalendarEvent.objects.bulk_create([
+            CalendarEvent(
+                user=self.user,
+                title=f'Event {i}',
+                description=None if i % 3 else f'Description {i}',
+                start_datetime=start + timedelta(hours=i),
+                end_datetime=start + timedelta(hours=i, minutes=30),
+                location='Room A' if i % 2 else None,
+                is_all_day=bool(i % 5 == 0),
+                google_event_id=f'google-{i}' if i % 4 else None,
+                synced_with_google=bool(i % 4),
+                last_synced_at=start if i % 4 else None,
+            )
+            for i in range(1000)
+        ])
+        queryset = CalendarEvent.objects.filter(user=self.user).order_by('start_datetime', 'id')
+        self.events = list(queryset)
+        self.rows = list(queryset.values_list(*EVENT_ROW_FIELDS))
+
+    def serializer_output(self):
+        return CalendarEventListSerializer(self.events, many=True).data
+
+    def fast_output(self):
+        return serialize_event_rows(self.rows)
+
+    def test_matches_list_serializer_output(self):
+        self.assertEqual(
+            json.dumps(self.fast_output()),
+            json.dumps(self.serializer_output())
+        )
+
+    def test_rows_skip_model_instances_and_drf_fields(self):
+        # The fast path's gain comes from never building CalendarEvent
+        # objects or running DRF fields; either would bring the cost back.
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch.object(CalendarEvent, 'from_db', side_effect=AssertionError('model instance built')):
+            response = client.get('/api/events/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'])
+
+        with mock.patch.object(DateTimeField, 'to_representation', side_effect=AssertionError('DRF field used')):
+            self.assertEqual(len(self.fast_output()), 1000)
+
+
+class EventExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        start = timezone.now()
+        CalendarEvent.objects.bulk_create([
+            CalendarEvent(
+                user=self.user,
+                title=f'Event {i}',
+                start_datetime=start + timedelta(hours=i),
+                end_datetime=start + timedelta(hours=i, minutes=30),
+                calendar_id='work' if i % 2 else 'primary',
+            )
+            for i in range(25)
+        ])
+        self.expected = serialize_event_rows(
+            CalendarEvent.objects.filter(user=self.user)
+            .order_by('start_datetime', 'id').values_list(*EVENT_ROW_FIELDS)
+        )
+
+    def export(self, url):
+        with self.settings(EVENTS_EXPORT_CHUNK_SIZE=7):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            chunks = [chunk.decode() for chunk in response.streaming_content]
+        return response, chunks
+
+    def test_streams_json_array_in_chunks(self):
+        response, chunks = self.export('/api/events/export/')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        # Opening bracket, one chunk per 7 rows, closing bracket.
+        self.assertEqual(len(chunks), 2 + 4)
+        self.assertEqual(json.loads(''.join(chunks)), self.expected)
+
+    def test_streams_ndjson(self):
+        response, chunks = self.export('/api/events/export/?output=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = ''.join(chunks).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected)
+
+    def test_applies_list_filters(self):
+        _, chunks = self.export('/api/events/export/?calendar_id=work')
+        events = json.loads(''.join(chunks))
+        self.assertEqual(events, [event for event in self.expected if event['calendar_id'] == 'work'])
+
+    def test_empty_export_is_valid_json(self):
+        _, chunks = self.export('/api/events/export/?calendar_id=missing')
+        self.assertEqual(json.loads(''.join(chunks)), [])
+
+    def test_rejects_unknown_output(self):
+        response = self.client.get('/api/events/export/?output=xml')
+        self.assertEqual(response.status_code, 400)
+
+
+class ICSTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ics')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, content, **data):
+        upload = SimpleUploadedFile('events.ics', content.encode(), content_type='text/calendar')
+        return self.client.post('/api/events/ics/', {'file': upload, **data}, format='multipart')
+
+    def test_round_trips_events(self):
+        start = datetime(2025, 3, 3, 9, 30, tzinfo=dt_timezone.utc)
+        CalendarEvent.objects.create(
+            user=self.user,
+            title='Stand-up; daily, with a long title that will need folding ' + 'é' * 40,
+            description='Line one\nLine two',
+            start_datetime=start,
+            end_datetime=start + timedelta(minutes=15),
+            location='Room 1',
+            recurrence_rule='RRULE:FREQ=WEEKLY;BYDAY=MO,WE\nEXDATE:20250305T093000Z',
+        )
+        CalendarEvent.objects.create(
+            user=self.user,
+            title='Holiday',
+            start_datetime=datetime(2025, 4, 18, tzinfo=dt_timezone.utc),
+            end_datetime=datetime(2025, 4, 19, tzinfo=dt_timezone.utc),
+            is_all_day=True,
+        )
+
+        response = self.client.get('/api/events/ics/')
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('DTSTART;VALUE=DATE:20250418\r\n', content)
+        self.assertIn('RRULE:FREQ=WEEKLY;BYDAY=MO,WE\r\n', content)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in content.split('\r\n')))
+
+        fields = ['title', 'description', 'start_datetime', 'end_datetime', 'location', 'is_all_day', 'recurrence_rule']
+        before = list(CalendarEvent.objects.order_by('start_datetime').values(*fields))
+        CalendarEvent.objects.all().delete()
+
+        response = self.upload(content, push='false')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'imported': 2, 'skipped': 0})
+        self.assertEqual(list(CalendarEvent.objects.order_by('start_datetime').values(*fields)), before)
+        self.assertFalse(GoogleOutboxEntry.objects.exists())
+
+    def test_imports_in_chunks_and_queues_pushes(self):
+        content = 'BEGIN:VCALENDAR\r\n' + ''.join(
+            'BEGIN:VEVENT\r\n'
+            f'DTSTART;TZID=Europe/Paris:20250601T{10 + i % 8:02d}0000\r\n'
+            'DURATION:PT45M\r\n'
+            f'SUMMARY:Event {i}\r\n'
+            'BEGIN:VALARM\r\nTRIGGER:-PT15M\r\nDESCRIPTION:Ignored\r\nEND:VALARM\r\n'
+            'END:VEVENT\r\n'
+            for i in range(25)
+        ) + 'BEGIN:VEVENT\r\nSUMMARY:No start\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n'
+
+        with self.settings(EVENTS_IMPORT_CHUNK_SIZE=10):
+            response = self.upload(content, calendar_id='work')
+        self.assertEqual(response.data, {'imported': 25, 'skipped': 1})
+
+        event = CalendarEvent.objects.get(title='Event 0')
+        self.assertEqual(event.start_datetime, datetime(2025, 6, 1, 8, tzinfo=dt_timezone.utc))
+        self.assertEqual(event.end_datetime - event.start_datetime, timedelta(minutes=45))
+        self.assertIsNone(event.description)
+        self.assertEqual(event.calendar_id, 'work')
+        self.assertEqual(GoogleOutboxEntry.objects.filter(operation=GoogleOutboxEntry.CREATE).count(), 25)
+        self.assertEqual(CalendarEventBucket.objects.filter(user=self.user).count(), 25)
+
+    def test_imported_recurrence_is_pushed_to_google(self):
+        content = (
+            'BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nDTSTART:20250303T093000Z\r\nDURATION:PT15M\r\n'
+            'SUMMARY:Stand-up\r\nRRULE:FREQ=WEEKLY;BYDAY=MO,WE\r\nEXDATE:20250305T093000Z\r\n'
+            'END:VEVENT\r\nEND:VCALENDAR\r\n'
+        )
+        self.assertEqual(self.upload(content).status_code, 201)
+
+        entry = GoogleOutboxEntry.objects.get()
+        body = GoogleCalendarService().google_event_body(entry.event)
+        self.assertEqual(body['recurrence'], ['RRULE:FREQ=WEEKLY;BYDAY=MO,WE', 'EXDATE:20250305T093000Z'])
+
+    def test_malformed_file_imports_nothing(self):
+        content = (
+            'BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nDTSTART:20250101T100000Z\r\n'
+            'SUMMARY:Fine\r\nEND:VEVENT\r\nthis is not a content line\r\nEND:VCALENDAR\r\n'
+        )
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CalendarEvent.objects.exists())
+
+
+class FakeBatchService(GoogleCalendarService):
+    # Records each batch and answers from ``responses``: a function of
+    # (method, params) returning (response, exception).
+    def __init__(self, responses=None):
+        super().__init__()
+        self.batches = []
+        self.responses = responses or (
+            lambda method, params: ({'id': params.get('eventId') or params['body']['id']}, None)
+        )
+
+    def google_event_body(self, event):
+        return {'summary': event.title}
+
+    def execute_batch(self, user, operations):
+        self.batches.append([(method, params) for _, method, params in operations])
+        return {request_id: self.responses(method, params) for request_id, method, params in operations}
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='outbox')
+        start = datetime(2025, 3, 3, 10, tzinfo=dt_timezone.utc)
+        self.event = CalendarEvent.objects.create(
+            user=self.user, title='Planning', start_datetime=start, end_datetime=start + timedelta(hours=1)
+        )
+
+    def test_update_after_create_in_one_claim_targets_the_created_event(self):
+        enqueue_event_push(self.event, GoogleOutboxEntry.CREATE)
+        # Queued while the create is being pushed, so both end up claimed together.
+        GoogleOutboxEntry.objects.update(status=GoogleOutboxEntry.PROCESSING)
+        enqueue_event_push(self.event, GoogleOutboxEntry.UPDATE)
+        GoogleOutboxEntry.objects.update(status=GoogleOutboxEntry.PENDING)
+
+        google_service = FakeBatchService()
+        self.assertEqual(process_entries(claim_due_entries(10), google_service), 2)
+
+        self.assertEqual([[method for method, _ in batch] for batch in google_service.batches], [['insert'], ['update']])
+        google_event_id = google_service.google_event_id_for(self.event)
+        self.assertEqual(google_service.batches[1][0][1]['eventId'], google_event_id)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.google_event_id, google_event_id)
+        self.assertTrue(self.event.synced_with_google)
+
+    def test_repeated_insert_is_recognised_by_its_id(self):
+        enqueue_event_push(self.event, GoogleOutboxEntry.CREATE)
+        # The first push reached Google but its response was lost.
+        google_service = FakeBatchService(lambda method, params: (
+            None, HttpError(mock.Mock(status=503), b'backend error')
+        ))
+        process_entries(claim_due_entries(10), google_service)
+        GoogleOutboxEntry.objects.update(next_attempt_at=timezone.now())
+
+        google_service = FakeBatchService(lambda method, params: (
+            None, HttpError(mock.Mock(status=409), b'duplicate')
+        ))
+        self.assertEqual(process_entries(claim_due_entries(10), google_service), 1)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.google_event_id, google_service.google_event_id_for(self.event))
+        self.assertEqual(GoogleOutboxEntry.objects.get().status, GoogleOutboxEntry.DONE)
+
+    def test_pushes_in_batches_of_at_most_fifty(self):
+        events = CalendarEvent.objects.bulk_create([
+            CalendarEvent(
+                user=self.user, title=f'Event {i}', start_datetime=self.event.start_datetime,
+                end_datetime=self.event.end_datetime
+            )
+            for i in range(119)
+        ]) + [self.event]
+        enqueue_event_pushes(events, GoogleOutboxEntry.CREATE)
+
+        google_service = FakeBatchService()
+        self.assertEqual(process_entries(claim_due_entries(200), google_service), 120)
+        self.assertEqual([len(batch) for batch in google_service.batches], [50, 50, 20])
+        self.assertFalse(CalendarEvent.objects.filter(google_event_id__isnull=True).exists())
+
+    @override_settings(GOOGLE_OUTBOX_MAX_ATTEMPTS=2)
+    def test_failed_pushes_are_retried_later_then_given_up(self):
+        enqueue_event_push(self.event, GoogleOutboxEntry.CREATE)
+        google_service = FakeBatchService(lambda method, params: (
+            None, HttpError(mock.Mock(status=500), b'backend error')
+        ))
+
+        self.assertEqual(process_entries(claim_due_entries(10), google_service), 0)
+        entry = GoogleOutboxEntry.objects.get()
+        self.assertEqual((entry.status, entry.attempts), (GoogleOutboxEntry.PENDING, 1))
+        self.assertIn('backend error', entry.last_error)
+        self.assertGreater(entry.next_attempt_at, timezone.now())
+        # Not due again until the backoff has passed.
+        self.assertEqual(claim_due_entries(10), [])
+
+        GoogleOutboxEntry.objects.update(next_attempt_at=timezone.now())
+        process_entries(claim_due_entries(10), google_service)
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts), (GoogleOutboxEntry.FAILED, 2))
+        self.assertEqual(claim_due_entries(10), [])
+
+    def test_delete_of_an_event_already_gone_from_google_is_done(self):
+        self.event.google_event_id = 'g-gone'
+        self.event.save()
+        enqueue_event_push(self.event, GoogleOutboxEntry.DELETE)
+        self.event.delete()
+
+        google_service = FakeBatchService(lambda method, params: (
+            None, HttpError(mock.Mock(status=404), b'not found')
+        ))
+        self.assertEqual(process_entries(claim_due_entries(10), google_service), 1)
+        self.assertEqual(google_service.batches, [[('delete', {'calendarId': 'primary', 'eventId': 'g-gone'})]])
+        self.assertEqual(GoogleOutboxEntry.objects.get().status, GoogleOutboxEntry.DONE)
+
+
+class OutboxWorkerTests(TransactionTestCase):
+    # push_google_outbox pushes from pool threads, which only see committed rows.
+    def setUp(self):
+        self.user = User.objects.create_user(username='outbox-worker')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.start = datetime(2025, 3, 3, 10, tzinfo=dt_timezone.utc)
+        self.synced = CalendarEvent.objects.create(
+            user=self.user, title='Synced', google_event_id='g-synced', synced_with_google=True,
+            start_datetime=self.start, end_datetime=self.start + timedelta(hours=1)
+        )
+        self.batches = []
+
+    def execute_batch(self, google_service, user, operations):
+        self.batches.append([(method, params) for _, method, params in operations])
+        return {
+            request_id: ({'id': params.get('eventId') or params['body']['id']}, None)
+            for request_id, method, params in operations
+        }
+
+    def test_api_writes_are_queued_and_pushed_by_the_worker(self):
+        with mock.patch.object(GoogleCalendarService, 'execute_batch', autospec=True, side_effect=self.execute_batch):
+            response = self.client.post('/api/events/', {
+                'title': 'New', 'start_datetime': self.start.isoformat(),
+                'end_datetime': (self.start + timedelta(hours=1)).isoformat(),
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+            created = CalendarEvent.objects.get(title='New')
+            self.client.patch(f'/api/events/{created.pk}/', {'title': 'Renamed'}, format='json')
+            self.client.delete(f'/api/events/{self.synced.pk}/')
+
+            # Requests only queue the changes.
+            self.assertEqual(self.batches, [])
+            self.assertEqual(
+                sorted(GoogleOutboxEntry.objects.values_list('operation', 'status')),
+                [(GoogleOutboxEntry.CREATE, GoogleOutboxEntry.PENDING), (GoogleOutboxEntry.DELETE, GoogleOutboxEntry.PENDING)]
+            )
+
+            call_command('push_google_outbox', once=True, stdout=StringIO())
+
+        pushed = sorted((method, params.get('eventId'), params.get('body', {}).get('summary')) for method, params in self.batches[0])
+        self.assertEqual(pushed, [('delete', 'g-synced', None), ('insert', None, 'Renamed')])
+        created.refresh_from_db()
+        self.assertEqual(created.google_event_id, GoogleCalendarService().google_event_id_for(created))
+        self.assertTrue(created.synced_with_google)
+        self.assertEqual(set(GoogleOutboxEntry.objects.values_list('status', flat=True)), {GoogleOutboxEntry.DONE})
+
+
+class RecurringEventListTests(TestCase):
+    def setUp(self):
+        clear_occurrence_cache()
+        self.user = User.objects.create_user(username='recurring')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.standup = CalendarEvent.objects.create(
+            user=self.user,
+            title='Stand-up',
+            start_datetime=datetime(2025, 1, 6, 9, tzinfo=dt_timezone.utc),
+            end_datetime=datetime(2025, 1, 6, 9, 15, tzinfo=dt_timezone.utc),
+            recurrence_rule='RRULE:FREQ=WEEKLY;BYDAY=MO,WE,FR\nEXDATE:20250305T090000Z',
+        )
+        CalendarEvent.objects.create(
+            user=self.user,
+            title='Review',
+            start_datetime=datetime(2025, 3, 5, 10, tzinfo=dt_timezone.utc),
+            end_datetime=datetime(2025, 3, 5, 11, tzinfo=dt_timezone.utc),
+        )
+
+    def week(self, **params):
+        query = {'start': '2025-03-03T00:00:00Z', 'end': '2025-03-09T23:59:59Z', **params}
+        return self.client.get('/api/events/', query)
+
+    def test_week_view_merges_occurrences(self):
+        response = self.week()
+        self.assertEqual(
+            [(event['title'], event['start_datetime']) for event in response.data['results']],
+            [
+                ('Stand-up', '2025-03-03T09:00:00Z'),
+                ('Review', '2025-03-05T10:00:00Z'),
+                ('Stand-up', '2025-03-07T09:00:00Z'),
+            ]
+        )
+        self.assertEqual(response.data['results'][0]['id'], self.standup.id)
+        self.assertEqual(response.data['results'][0]['end_datetime'], '2025-03-03T09:15:00Z')
+
+    def test_window_without_offset_is_read_as_utc(self):
+        response = self.week(start='2025-03-03T00:00:00', end='2025-03-09T23:59:59')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], self.week().data['results'])
+
+    def test_overlap_mode_includes_occurrence_in_progress(self):
+        response = self.client.get('/api/events/', {
+            'start': '2025-03-07T09:10:00Z', 'end': '2025-03-07T12:00:00Z', 'mode': 'overlap'
+        })
+        self.assertEqual(
+            [event['start_datetime'] for event in response.data['results']],
+            ['2025-03-07T09:00:00Z']
+        )
+
+    def test_pages_through_occurrences(self):
+        seen = []
+        url = '/api/events/?start=2025-01-01T00:00:00Z&end=2025-12-31T23:59:59Z&page_size=7'
+        while url:
+            response = self.client.get(url)
+            seen.extend((event['start_datetime'], event['id']) for event in response.data['results'])
+            url = response.data['next']
+        # 52 Mondays, 52 Wednesdays and 51 Fridays from Jan 6, minus the
+        # excluded date, plus the single event.
+        self.assertEqual(len(seen), 52 + 52 + 51 - 1 + 1)
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(len(set(seen)), len(seen))
+
+    def test_expansions_are_cached_until_the_event_changes(self):
+        with mock.patch('calendar_api.recurrence.expand_rule', wraps=expand_rule) as expand:
+            self.week()
+            self.week()
+            self.assertEqual(expand.call_count, 1)
+
+            self.standup.title = 'Daily stand-up'
+            self.standup.save()
+            response = self.week()
+            self.assertEqual(expand.call_count, 2)
+        self.assertEqual(response.data['results'][0]['title'], 'Daily stand-up')
+
+    def test_without_a_window_the_event_itself_is_listed(self):
+        response = self.client.get('/api/events/')
+        self.assertEqual([event['title'] for event in response.data['results']], ['Stand-up', 'Review'])
+
+
+class FreeBusyTests(TestCase):
+    def setUp(self):
+        clear_occurrence_cache()
+        self.users = [User.objects.create_user(username=f'busy{i}') for i in range(10)]
+        Group.objects.create(name='team').user_set.add(*self.users)
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+        monday = datetime(2025, 3, 3, tzinfo=dt_timezone.utc)
+        events = []
+        for user in self.users:
+            for day in range(5):
+                for hour in (9, 11, 14):
+                    start = monday + timedelta(days=day, hours=hour)
+                    events.append(CalendarEvent(
+                        user=user, title='Meeting',
+                        start_datetime=start, end_datetime=start + timedelta(hours=1),
+                    ))
+            # Overlaps the 14:00 meetings, and must not count.
+            events.append(CalendarEvent(
+                user=user, title='Cancelled', status='cancelled',
+                start_datetime=monday + timedelta(hours=8), end_datetime=monday + timedelta(hours=18),
+            ))
+        CalendarEventBucket.rebuild_for(CalendarEvent.objects.bulk_create(events))
+        CalendarEvent.objects.create(
+            user=self.users[0], title='Lunch',
+            start_datetime=monday + timedelta(hours=11, minutes=30),
+            end_datetime=monday + timedelta(hours=12, minutes=30),
+            recurrence_rule='RRULE:FREQ=DAILY;COUNT=3',
+        )
+        # Started the previous week and runs into this one.
+        CalendarEvent.objects.create(
+            user=self.users[1], title='Trip',
+            start_datetime=monday - timedelta(days=3), end_datetime=monday + timedelta(hours=10),
+        )
+        self.query = {
+            'start': '2025-03-03T00:00:00Z',
+            'end': '2025-03-10T00:00:00Z',
+            'users': ','.join(str(user.id) for user in self.users),
+        }
+
+    def test_merges_busy_intervals(self):
+        response = self.client.get('/api/freebusy/', self.query)
+        self.assertEqual(response.status_code, 200)
+        first = response.data['users'][str(self.users[0].id)]
+        self.assertEqual(first[:3], [
+            ['2025-03-03T09:00:00Z', '2025-03-03T10:00:00Z'],
+            ['2025-03-03T11:00:00Z', '2025-03-03T12:30:00Z'],
+            ['2025-03-03T14:00:00Z', '2025-03-03T15:00:00Z'],
+        ])
+        self.assertEqual(len(first), 15)
+        second = response.data['users'][str(self.users[1].id)]
+        self.assertEqual(second[0], ['2025-03-03T00:00:00Z', '2025-03-03T10:00:00Z'])
+        self.assertEqual(response.data['busy'][:2], [
+            ['2025-03-03T00:00:00Z', '2025-03-03T10:00:00Z'],
+            ['2025-03-03T11:00:00Z', '2025-03-03T12:30:00Z'],
+        ])
+
+    def test_filters_calendars_and_validates_input(self):
+        response = self.client.get('/api/freebusy/', {**self.query, 'calendar_id': 'other'})
+        self.assertEqual(response.data['busy'], [])
+        self.assertEqual(self.client.get('/api/freebusy/', {'start': self.query['start']}).status_code, 400)
+        self.assertEqual(self.client.get('/api/freebusy/', {**self.query, 'users': 'x'}).status_code, 400)
+
+    def test_window_without_offset_is_read_as_utc(self):
+        expected = self.client.get('/api/freebusy/', self.query).data
+        for start, end in (('2025-03-03T00:00:00', '2025-03-10T00:00:00'), ('2025-03-03T00:00:00Z', '2025-03-10T00:00:00')):
+            response = self.client.get('/api/freebusy/', {**self.query, 'start': start, 'end': end})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, expected)
+
+    def test_only_own_and_group_members_are_visible(self):
+        outsider = User.objects.create_user(username='outsider')
+        self.assertEqual(self.client.get('/api/freebusy/', {**self.query, 'users': ''}).status_code, 200)
+        hidden = self.client.get('/api/freebusy/', {**self.query, 'users': f'{self.users[1].id},{outsider.id}'})
+        unknown = self.client.get('/api/freebusy/', {**self.query, 'users': '999999'})
+        self.assertEqual(hidden.status_code, 403)
+        self.assertEqual(hidden.data, unknown.data)
+        self.assertNotIn(str(outsider.id), hidden.data['error'])
+
+        self.client.force_authenticate(outsider)
+        response = self.client.get('/api/freebusy/', {**self.query, 'users': str(self.users[0].id)})
+        self.assertEqual(response.status_code, 403)
+
+    def test_ten_user_week_takes_two_queries(self):
+        # One for single events through the buckets, one for recurring
+        # masters, however many users are asked for.
+        start = datetime(2025, 3, 3, tzinfo=dt_timezone.utc)
+        user_ids = [user.id for user in self.users]
+        with self.assertNumQueries(2):
+            busy = busy_intervals(user_ids, start, start + timedelta(days=7))
+        self.assertEqual(sorted(busy), sorted(user_ids))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='poller')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        start = timezone.now()
+        self.event = CalendarEvent.objects.create(
+            user=self.user, title='Polled',
+            start_datetime=start, end_datetime=start + timedelta(hours=1),
+        )
+
+    def test_unchanged_events_answer_304_with_one_query(self):
+        response = self.client.get('/api/events/')
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/events/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_events_and_query(self):
+        etag = self.client.get('/api/events/')['ETag']
+        self.assertNotEqual(self.client.get('/api/events/?page_size=5')['ETag'], etag)
+
+        CalendarEvent.objects.filter(pk=self.event.pk).update(last_synced_at=timezone.now())
+        response = self.client.get('/api/events/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        self.event.delete()
+        self.assertEqual(self.client.get('/api/events/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_calendars_use_google_etag(self):
+        service = mock.Mock()
+        service.calendarList().list().execute.return_value = {
+            'etag': '"p33c9v"', 'items': [{'id': 'primary'}]
+        }
+        with mock.patch.object(GoogleCalendarService, 'get_calendar_service', return_value=service):
+            response = self.client.get('/api/calendars/')
+            self.assertEqual(response['ETag'], '"p33c9v"')
+            response = self.client.get('/api/calendars/', HTTP_IF_NONE_MATCH='"p33c9v"')
+        self.assertEqual(response.status_code, 304)
+
+
+class CalendarListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='calendars')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.service = mock.Mock()
+        self.service.calendarList().list().execute.side_effect = [
+            {'etag': '"v1"', 'items': [{'id': 'primary'}]},
+            {'etag': '"v2"', 'items': [{'id': 'primary'}, {'id': 'work'}]},
+        ]
+        self.execute = self.service.calendarList().list().execute
+        patcher = mock.patch.object(GoogleCalendarService, 'get_calendar_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def calendar_ids(self, url='/api/calendars/'):
+        return [calendar['id'] for calendar in self.client.get(url).data['calendars']]
+
+    def test_fresh_list_is_served_from_cache(self):
+        self.assertEqual(self.calendar_ids(), ['primary'])
+        self.assertEqual(self.calendar_ids(), ['primary'])
+        self.assertEqual(self.execute.call_count, 1)
+
+    def test_stale_list_is_served_while_revalidating(self):
+        class InlineThread:
+            def __init__(self, target, args, daemon):
+                self.run = lambda: target(*args)
+
+            def start(self):
+                self.run()
+
+        self.calendar_ids()
+        with self.settings(GOOGLE_CALENDAR_LIST_TTL=0), \
+                mock.patch('calendar_api.services.threading.Thread', InlineThread):
+            # The stale copy is answered while the refresh runs.
+            self.assertEqual(self.calendar_ids(), ['primary'])
+        self.assertEqual(self.execute.call_count, 2)
+        self.assertEqual(self.calendar_ids(), ['primary', 'work'])
+
+    def test_refresh_param_and_invalidation_bypass_cache(self):
+        self.calendar_ids()
+        self.assertEqual(self.calendar_ids('/api/calendars/?refresh=true'), ['primary', 'work'])
+        self.assertEqual(self.execute.call_count, 2)
+
+        self.execute.side_effect = [{'etag': '"v3"', 'items': []}]
+        GoogleCalendarService().invalidate_calendar_list(self.user)
+        self.assertEqual(self.calendar_ids(), [])
+
+
+class GoogleWatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='watcher')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.service = mock.Mock()
+        self.service.events().watch().execute.return_value = {
+            'resourceId': 'resource-1', 'expiration': '4102444800000'
+        }
+        patcher = mock.patch.object(GoogleCalendarService, 'get_calendar_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start(self):
+        with self.settings(GOOGLE_WEBHOOK_URL='https://example.com/api/webhooks/google/'):
+            response = self.client.post('/api/watch/', {'calendar_id': 'primary'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return GoogleWatchChannel.objects.get(channel_id=response.data['channel_id'])
+
+    def notify(self, headers):
+        return APIClient().post('/api/webhooks/google/', headers=headers)
+
+    def test_start_watch_registers_channel_and_replaces_old_one(self):
+        first = self.start()
+        self.assertEqual(first.resource_id, 'resource-1')
+        self.assertEqual(first.expiration, datetime(2100, 1, 1, tzinfo=dt_timezone.utc))
+        second = self.start()
+        self.assertEqual(list(GoogleWatchChannel.objects.all()), [second])
+        self.service.channels().stop.assert_called_with(body={'id': first.channel_id, 'resourceId': 'resource-1'})
+
+    def test_webhook_validates_channel_headers(self):
+        channel = self.start()
+        with mock.patch('calendar_api.watch.schedule_sync') as schedule:
+            self.assertEqual(self.notify(notification_headers(channel, 'sync')).status_code, 200)
+            schedule.assert_not_called()
+
+            self.assertEqual(self.notify(notification_headers(channel)).status_code, 200)
+            schedule.assert_called_once_with(self.user.id, 'primary')
+
+            forged = {**notification_headers(channel), 'X-Goog-Channel-Token': 'guess'}
+            self.assertEqual(self.notify(forged).status_code, 403)
+            moved = {**notification_headers(channel), 'X-Goog-Resource-ID': 'other'}
+            self.assertEqual(self.notify(moved).status_code, 403)
+            unknown = {**notification_headers(channel), 'X-Goog-Channel-ID': 'unknown'}
+            self.assertEqual(self.notify(unknown).status_code, 404)
+            self.assertEqual(schedule.call_count, 1)
+
+    def test_notifications_are_debounced_per_calendar(self):
+        timers = []
+
+        class FakeTimer:
+            def __init__(self, interval, function, args):
+                self.run = lambda: function(*args)
+                timers.append(self)
+
+            def start(self):
+                pass
+
+        with mock.patch('calendar_api.watch.threading.Timer', FakeTimer), \
+                mock.patch.object(GoogleCalendarService, 'sync_events_from_google') as sync:
+            for _ in range(5):
+                schedule_sync(self.user.id, 'primary')
+            schedule_sync(self.user.id, 'work')
+            self.assertEqual(len(timers), 2)
+
+            # Notifications during the sync add up to one re-run after it.
+            sync.side_effect = lambda user, calendar_id: [schedule_sync(self.user.id, 'primary') for _ in range(3)]
+            timers[0].run()
+            sync.assert_called_once_with(self.user, 'primary')
+            self.assertEqual(len(timers), 3)
+            self.assertFalse(schedule_sync(self.user.id, 'primary'))
+            self.assertEqual(len(timers), 3)
+
+            sync.side_effect = None
+            timers[2].run()
+            timers[1].run()
+            self.assertEqual(sync.call_count, 3)
+            # Nothing is pending any more, so the next notification schedules a sync.
+            self.assertTrue(schedule_sync(self.user.id, 'primary'))
+            self.assertEqual(len(timers), 4)
+            timers[3].run()
+
+    def test_renews_expiring_channels(self):
+        channel = self.start()
+        with self.settings(GOOGLE_WEBHOOK_URL='https://example.com/api/webhooks/google/'):
+            renewed, failed = renew_expiring_watches(window=0)
+        self.assertEqual((renewed, failed), (0, 0))
+
+        GoogleWatchChannel.objects.filter(pk=channel.pk).update(expiration=timezone.now())
+        with self.settings(GOOGLE_WEBHOOK_URL='https://example.com/api/webhooks/google/'):
+            renewed, failed = renew_expiring_watches(window=60)
+        self.assertEqual((renewed, failed), (1, 0))
+        self.assertFalse(GoogleWatchChannel.objects.filter(pk=channel.pk).exists())
+        self.assertEqual(GoogleWatchChannel.objects.count(), 1)
+
+
+def google_event(google_event_id, title, start='2025-03-03T10:00:00Z', end='2025-03-03T11:00:00Z', **fields):
+    return dict({
+        'id': google_event_id, 'summary': title,
+        'start': {'dateTime': start}, 'end': {'dateTime': end},
+    }, **fields)
+
+
+class GoogleEventSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sync')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.google_service = GoogleCalendarService()
+        self.google_service._apply_google_events(self.user, 'primary', [
+            google_event('g1', 'Standup'), google_event('g2', 'Review'),
+        ])
+        google_api.reset_limits()
+
+    def sync(self, responses, **kwargs):
+        # Runs a sync against a fake events().list that answers with
+        # ``responses`` in order (a dict, or an exception to raise) and
+        # returns the parameters of each call.
+        calls = []
+        responses = iter(responses)
+
+        def list_events(**params):
+            calls.append(params)
+            response = next(responses)
+            request = mock.Mock()
+            if isinstance(response, Exception):
+                request.execute.side_effect = response
+            else:
+                request.execute.return_value = response
+            return request
+
+        service = mock.Mock()
+        service.events().list.side_effect = list_events
+        with mock.patch.object(GoogleCalendarService, 'get_calendar_service', return_value=service):
+            synced = self.google_service.sync_events_from_google(self.user, **kwargs)
+        return synced, calls
+
+    def test_instances_of_a_local_recurring_event_are_not_listed_twice(self):
+        start = datetime(2025, 3, 3, 9, tzinfo=dt_timezone.utc)
+        CalendarEvent.objects.create(
+            user=self.user, title='Daily', google_event_id='abc', synced_with_google=True,
+            start_datetime=start, end_datetime=start + timedelta(minutes=15),
+            recurrence_rule='RRULE:FREQ=DAILY;COUNT=3',
+        )
+        instances = [
+            google_event(
+                f'abc_2025030{day}T090000Z', 'Daily', recurringEventId='abc',
+                start=f'2025-03-0{day}T09:00:00Z', end=f'2025-03-0{day}T09:15:00Z',
+            )
+            for day in (3, 4, 5)
+        ]
+        # An instance stored by a sync from before instances were skipped.
+        self.google_service._apply_google_events(self.user, 'primary', [google_event('abc_20250303T090000Z', 'Daily')])
+
+        self.sync([{'items': instances, 'nextSyncToken': 't1'}])
+
+        self.assertFalse(CalendarEvent.objects.filter(google_event_id__startswith='abc_').exists())
+        response = self.client.get('/api/events/', {'start': '2025-03-03T00:00:00Z', 'end': '2025-03-06T00:00:00Z'})
+        self.assertEqual(
+            [event['start_datetime'] for event in response.data['results'] if event['title'] == 'Daily'],
+            ['2025-03-03T09:00:00Z', '2025-03-04T09:00:00Z', '2025-03-05T09:00:00Z']
+        )
+
+    def test_incremental_sync_uses_stored_sync_token(self):
+        synced, calls = self.sync([{'items': [google_event('g3', 'Planning')], 'nextSyncToken': 't1'}])
+        self.assertEqual(len(synced), 1)
+        self.assertIn('timeMin', calls[0])
+        self.assertNotIn('syncToken', calls[0])
+        sync_state = GoogleSyncState.objects.get(user=self.user, calendar_id='primary')
+        self.assertEqual(sync_state.sync_token, 't1')
+        self.assertIsNotNone(sync_state.last_full_sync_at)
+
+        # Only changes come back now, including deletions.
+        synced, calls = self.sync([{
+            'items': [{'id': 'g1', 'status': 'cancelled'}, google_event('g2', 'Review renamed')],
+            'nextSyncToken': 't2',
+        }])
+        self.assertEqual(calls[0]['syncToken'], 't1')
+        self.assertNotIn('timeMin', calls[0])
+        self.assertFalse(CalendarEvent.objects.filter(google_event_id='g1').exists())
+        self.assertEqual(CalendarEvent.objects.get(google_event_id='g2').title, 'Review renamed')
+        self.assertEqual(GoogleSyncState.objects.get(pk=sync_state.pk).sync_token, 't2')
+
+    def test_expired_sync_token_falls_back_to_full_sync(self):
+        GoogleSyncState.objects.create(user=self.user, calendar_id='primary', sync_token='expired')
+        synced, calls = self.sync([
+            HttpError(mock.Mock(status=410), b'Sync token is no longer valid'),
+            {'items': [google_event('g1', 'Standup')], 'nextSyncToken': 'fresh'},
+        ])
+        self.assertEqual(calls[0]['syncToken'], 'expired')
+        self.assertNotIn('syncToken', calls[1])
+        self.assertEqual(len(synced), 1)
+        self.assertEqual(GoogleSyncState.objects.get(user=self.user).sync_token, 'fresh')
+
+    def test_follows_page_tokens(self):
+        synced, calls = self.sync([
+            {'items': [google_event('g3', 'Page one')], 'nextPageToken': 'p2'},
+            {'items': [google_event('g4', 'Page two')], 'nextSyncToken': 't1'},
+        ])
+        self.assertEqual([call.get('pageToken') for call in calls], [None, 'p2'])
+        self.assertEqual(calls[0]['maxResults'], GoogleCalendarService.MAX_PAGE_SIZE)
+        self.assertEqual(len(synced), 2)
+        self.assertEqual(CalendarEvent.objects.filter(google_event_id__in=['g3', 'g4']).count(), 2)
+        # nextSyncToken only comes with the last page.
+        self.assertEqual(GoogleSyncState.objects.get(user=self.user).sync_token, 't1')
+
+    def test_list_events_stops_reading_pages_at_max_results(self):
+        pages = [
+            {'items': [google_event(f'g{page}-{i}', 'Event') for i in range(3)], 'nextPageToken': f'p{page + 1}'}
+            for page in range(3)
+        ]
+        calls = []
+
+        def list_events(**params):
+            calls.append(params)
+            request = mock.Mock()
+            request.execute.return_value = pages[len(calls) - 1]
+            return request
+
+        service = mock.Mock()
+        service.events().list.side_effect = list_events
+        with mock.patch.object(GoogleCalendarService, 'get_calendar_service', return_value=service):
+            events = self.google_service.list_events(self.user, max_results=4)
+        self.assertEqual([event['id'] for event in events], ['g0-0', 'g0-1', 'g0-2', 'g1-0'])
+        self.assertEqual(len(calls), 2)
+
+    def test_applies_events_in_bulk(self):
+        def apply(count, title):
+            events = [google_event(f'bulk-{i}', title) for i in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                synced = self.google_service._apply_google_events(self.user, 'primary', events)
+            self.assertEqual(len(synced), count)
+            return len(queries)
+
+        # A handful of bulk statements, not a query or two per event.
+        self.assertLess(apply(200, 'Created'), 20)
+        self.assertLess(apply(200, 'Renamed'), 20)
+        self.assertLess(apply(200, 'Renamed'), 10)
+        self.assertEqual(set(CalendarEvent.objects.filter(google_event_id__startswith='bulk-').values_list(
+            'title', flat=True
+        )), {'Renamed'})
+        self.assertEqual(CalendarEventBucket.objects.filter(event__google_event_id__startswith='bulk-').count(), 200)
+
+    def test_only_changed_events_are_rewritten(self):
+        before = dict(CalendarEvent.objects.values_list('google_event_id', 'updated_at'))
+        self.google_service._apply_google_events(self.user, 'primary', [
+            google_event('g1', 'Standup'),
+            google_event('g2', 'Review', start='2025-03-17T10:00:00Z', end='2025-03-17T11:00:00Z'),
+        ])
+        after = dict(CalendarEvent.objects.values_list('google_event_id', 'updated_at'))
+        self.assertEqual(after['g1'], before['g1'])
+        self.assertGreater(after['g2'], before['g2'])
+
+        moved = CalendarEvent.objects.get(google_event_id='g2')
+        self.assertEqual(list(moved.buckets.values_list('bucket', flat=True)), [week_bucket(moved.start_datetime)])
+        self.assertTrue(all(
+            event.last_synced_at >= event.updated_at for event in CalendarEvent.objects.all()
+        ))
+
+    def test_unpushed_local_edits_survive_a_sync(self):
+        event = CalendarEvent.objects.get(google_event_id='g1')
+        response = self.client.patch(f'/api/events/{event.pk}/', {'title': 'Local edit'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        # A sync lands before the outbox has pushed the edit.
+        self.google_service._apply_google_events(self.user, 'primary', [
+            google_event('g1', 'Standup'),
+            google_event('g2', 'Review moved', start='2025-03-04T10:00:00Z', end='2025-03-04T11:00:00Z'),
+        ])
+
+        event.refresh_from_db()
+        self.assertEqual(event.title, 'Local edit')
+        self.assertFalse(event.synced_with_google)
+        entry = GoogleOutboxEntry.objects.get(event=event)
+        self.assertEqual(entry.status, GoogleOutboxEntry.PENDING)
+        self.assertEqual(self.google_service.google_event_body(event)['summary'], 'Local edit')
+
+        # Rows without local changes still follow Google.
+        self.assertEqual(CalendarEvent.objects.get(google_event_id='g2').title, 'Review moved')
+
+        # An entry being pushed right now protects the row as well.
+        GoogleOutboxEntry.objects.filter(pk=entry.pk).update(status=GoogleOutboxEntry.PROCESSING)
+        CalendarEvent.objects.filter(pk=event.pk).update(synced_with_google=True)
+        self.google_service._apply_google_events(self.user, 'primary', [google_event('g1', 'Standup')])
+        event.refresh_from_db()
+        self.assertEqual(event.title, 'Local edit')
+
+
+class MultiCalendarSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        google_api.reset_limits()
+        self.user = User.objects.create_user(username='multi')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.calendars = ['primary', 'work', 'team']
+        self.transports = set()
+        self.lock = threading.Lock()
+        # Every calendar's request waits here for the other two, so the sync
+        # only succeeds if all three run at the same time.
+        self.barrier = threading.Barrier(len(self.calendars), timeout=5)
+
+        service = mock.Mock()
+        service.calendarList().list().execute.return_value = {'items': [
+            {'id': calendar_id, 'accessRole': 'owner'} for calendar_id in self.calendars
+        ] + [{'id': 'busy-only', 'accessRole': 'freeBusyReader'}]}
+        service.events().list.side_effect = self.list_events
+        patches = [
+            mock.patch.object(GoogleCalendarService, 'get_calendar_service', return_value=service),
+            mock.patch.object(GoogleCalendarService, 'get_credentials_from_user', return_value=mock.Mock()),
+            mock.patch.object(GoogleCalendarService, '_worker_http', side_effect=lambda credentials: object()),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def list_events(self, calendarId, **params):
+        def execute(http):
+            with self.lock:
+                self.transports.add(id(http))
+            self.barrier.wait()
+            if calendarId == 'team':
+                raise HttpError(mock.Mock(status=500), b'down')
+            start = '2025-03-03T10:00:00Z'
+            return {
+                'items': [{
+                    'id': f'{calendarId}-1', 'summary': calendarId,
+                    'start': {'dateTime': start}, 'end': {'dateTime': start},
+                }],
+                'nextSyncToken': f'{calendarId}-token',
+            }
+        request = mock.Mock()
+        request.execute.side_effect = execute
+        return request
+
+    def test_syncs_calendars_concurrently(self):
+        # The failing calendar is reported straight away, not retried.
+        with self.settings(GOOGLE_API_REQUEST_MAX_RETRIES=0):
+            response = self.client.post('/api/sync/', {'all_calendars': True}, format='json')
+
+        self.assertEqual(response.data['calendars'], {'primary': 1, 'work': 1, 'team': 0})
+        self.assertEqual(list(response.data['failed']), ['team'])
+        self.assertEqual(len(self.transports), 3)
+        self.assertEqual(
+            set(CalendarEvent.objects.values_list('google_event_id', 'calendar_id')),
+            {('primary-1', 'primary'), ('work-1', 'work')}
+        )
+        self.assertEqual(
+            dict(GoogleSyncState.objects.values_list('calendar_id', 'sync_token')),
+            {'primary': 'primary-token', 'work': 'work-token', 'team': None}
+        )
+
+
+class SyncAllCommandTests(TestCase):
+    def setUp(self):
+        # The command switches the process to background retries.
+        self.addCleanup(google_api.reset_limits)
+        now = timezone.now()
+        self.users = {}
+        # fresh synced a minute ago, stale a day ago, new never. None of them
+        # has events, which must not make them look never synced.
+        for name, synced_ago in (('fresh', timedelta(minutes=1)), ('stale', timedelta(days=1)), ('new', None)):
+            user = User.objects.create_user(username=name)
+            GoogleOAuthToken.objects.create(
+                user=user, access_token='a', refresh_token='r', expires_in=3600,
+                expires_at=now + timedelta(hours=1), scope='calendar',
+            )
+            if synced_ago:
+                GoogleSyncState.objects.create(user=user, last_synced_at=now - synced_ago)
+            self.users[name] = user
+        User.objects.create_user(username='not-connected')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = os.path.join(directory.name, 'checkpoint.json')
+
+    def run_command(self, **options):
+        synced = []
+
+        def sync_all_calendars(service, user, full_sync=False):
+            synced.append(user.username)
+            return {'primary': 2}, {}
+
+        with mock.patch.object(GoogleCalendarService, 'sync_all_calendars', sync_all_calendars):
+            call_command(
+                'sync_all', processes=0, shard_size=1, rate=0,
+                checkpoint=self.checkpoint, stdout=StringIO(), **options
+            )
+        return synced
+
+    def test_syncs_connected_users_most_stale_first(self):
+        self.assertEqual(self.run_command(), ['new', 'stale', 'fresh'])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resumes_from_checkpoint(self):
+        with open(self.checkpoint, 'w') as checkpoint_file:
+            json.dump({'started_at': '2025-01-01T00:00:00+00:00', 'done': [self.users['new'].id]}, checkpoint_file)
+        self.assertEqual(self.run_command(), ['stale', 'fresh'])
+
+        with open(self.checkpoint, 'w') as checkpoint_file:
+            json.dump({'started_at': '2025-01-01T00:00:00+00:00', 'done': [self.users['new'].id]}, checkpoint_file)
+        self.assertEqual(self.run_command(fresh=True), ['new', 'stale', 'fresh'])
+
+    def test_crashed_worker_fails_only_its_shard(self):
+        for i in range(3):
+            user = User.objects.create_user(username=f'later{i}')
+            GoogleOAuthToken.objects.create(
+                user=user, access_token='a', refresh_token='r', expires_in=3600,
+                expires_at=timezone.now() + timedelta(hours=1), scope='calendar',
+            )
+        # The workers are forked, so they report back through a file.
+        synced_log = os.path.join(os.path.dirname(self.checkpoint), 'synced')
+
+        def sync_all_calendars(service, user, full_sync=False):
+            if user.username == 'stale':
+                os._exit(1)
+            with open(synced_log, 'a') as log:
+                log.write(f'{user.username}\n')
+            return {'primary': 2}, {}
+
+        stdout, stderr = StringIO(), StringIO()
+        with mock.patch.object(GoogleCalendarService, 'sync_all_calendars', sync_all_calendars):
+            call_command(
+                'sync_all', processes=2, shard_size=1, rate=0,
+                checkpoint=self.checkpoint, stdout=stdout, stderr=stderr
+            )
+        self.assertIn('Error syncing shard of 1 users: worker process died', stderr.getvalue())
+        self.assertIn('Synced 6 users (10 events, 1 failed)', stdout.getvalue())
+        with open(synced_log) as log:
+            self.assertEqual(sorted(set(log.read().split())), ['fresh', 'later0', 'later1', 'later2', 'new'])
+
+    def test_checkpoint_only_records_synced_users(self):
+        def sync_all_calendars(service, user, full_sync=False):
+            if user.username == 'new':
+                raise HttpError(mock.Mock(status=500), b'down')
+            if user.username == 'fresh':
+                raise KeyboardInterrupt
+            return {'primary': 2}, {}
+
+        with mock.patch.object(GoogleCalendarService, 'sync_all_calendars', sync_all_calendars), \
+                self.assertRaises(KeyboardInterrupt):
+            call_command(
+                'sync_all', processes=0, shard_size=1, rate=0,
+                checkpoint=self.checkpoint, stdout=StringIO()
+            )
+        with open(self.checkpoint) as checkpoint_file:
+            self.assertEqual(json.load(checkpoint_file)['done'], [self.users['stale'].id])
+
+
+def fake_token_refresh(token='refreshed', delay=0, calls=None):
+    # Stands in for Credentials.refresh, which would call Google's token endpoint.
+    def refresh(credentials, request):
+        if calls is not None:
+            calls.append(credentials.refresh_token)
+        time.sleep(delay)
+        credentials.token = token
+        credentials.expiry = (timezone.now() + timedelta(hours=1)).replace(tzinfo=None)
+    return refresh
+
+
+class GoogleCredentialsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='credentials')
+        self.token = GoogleOAuthToken.objects.create(
+            user=self.user, access_token='access', refresh_token='refresh', expires_in=3600,
+            expires_at=timezone.now() + timedelta(hours=1), scope='calendar',
+        )
+        self.google_service = GoogleCalendarService()
+        self.google_service.invalidate_credentials(self.user)
+        self.addCleanup(self.google_service.invalidate_credentials, self.user)
+
+    def test_credentials_are_cached_until_replaced(self):
+        with self.assertNumQueries(1):
+            credentials = self.google_service.get_credentials_from_user(self.user)
+        with self.assertNumQueries(0):
+            self.assertIs(self.google_service.get_credentials_from_user(self.user), credentials)
+
+        credentials.token = 'new-access'
+        self.google_service.save_credentials_to_user(self.user, credentials)
+        self.assertEqual(self.google_service.get_credentials_from_user(self.user).token, 'new-access')
+
+    def test_expired_cache_entry_rereads_the_token(self):
+        cached = self.google_service.get_credentials_from_user(self.user)
+        cached.expiry = (timezone.now() - timedelta(minutes=1)).replace(tzinfo=None)
+        # Refreshed by another process meanwhile.
+        GoogleOAuthToken.objects.filter(pk=self.token.pk).update(access_token='other-process')
+        credentials = self.google_service.get_credentials_from_user(self.user)
+        self.assertEqual(credentials.token, 'other-process')
+        self.assertFalse(credentials.expired)
+
+    def test_refresh_command_refreshes_expiring_tokens(self):
+        other = User.objects.create_user(username='later')
+        GoogleOAuthToken.objects.create(
+            user=other, access_token='later', refresh_token='r', expires_in=3600,
+            expires_at=timezone.now() + timedelta(days=1), scope='calendar',
+        )
+        GoogleOAuthToken.objects.filter(pk=self.token.pk).update(expires_at=timezone.now() + timedelta(minutes=5))
+
+        calls = []
+        with mock.patch.object(Credentials, 'refresh', fake_token_refresh(calls=calls)):
+            call_command('refresh_google_tokens', window=600, stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(calls, ['refresh'])
+        token = GoogleOAuthToken.objects.get(user=self.user)
+        self.assertEqual(token.access_token, 'refreshed')
+        self.assertGreater(token.expires_at, timezone.now() + timedelta(minutes=50))
+        self.assertEqual(self.google_service.get_credentials_from_user(self.user).token, 'refreshed')
+        self.assertEqual(GoogleOAuthToken.objects.get(user=other).access_token, 'later')
+
+    @override_settings(GOOGLE_SERVICE_CACHE_SIZE=2)
+    def test_credential_cache_is_bounded(self):
+        users = [self.user] + [User.objects.create_user(username=f'user-{i}') for i in range(2)]
+        for user in users[1:]:
+            GoogleOAuthToken.objects.create(
+                user=user, access_token='access', refresh_token='refresh', expires_in=3600,
+                expires_at=timezone.now() + timedelta(hours=1), scope='calendar',
+            )
+            self.addCleanup(self.google_service.invalidate_credentials, user)
+        for user in users:
+            self.google_service.get_credentials_from_user(user)
+        with self.assertNumQueries(0):
+            self.google_service.get_credentials_from_user(users[2])
+        with self.assertNumQueries(1):
+            self.google_service.get_credentials_from_user(users[0])
+
+    def test_rejected_refresh_token_is_not_retried(self):
+        GoogleOAuthToken.objects.filter(pk=self.token.pk).update(expires_at=timezone.now() - timedelta(minutes=5))
+
+        def revoked(credentials, request):
+            raise RefreshError('invalid_grant: Token has been expired or revoked.', {'error': 'invalid_grant'})
+
+        with mock.patch.object(Credentials, 'refresh', revoked):
+            stderr = StringIO()
+            call_command('refresh_google_tokens', stdout=StringIO(), stderr=stderr)
+        self.assertIn('invalid_grant', stderr.getvalue())
+        self.assertIsNotNone(GoogleOAuthToken.objects.get(pk=self.token.pk).invalid_at)
+        self.assertIsNone(self.google_service.get_credentials_from_user(self.user))
+
+        calls = []
+        with mock.patch.object(Credentials, 'refresh', fake_token_refresh(calls=calls)):
+            call_command('refresh_google_tokens', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(calls, [])
+
+        # Connecting again stores fresh tokens and clears the mark.
+        self.google_service.save_credentials_to_user(self.user, Credentials(
+            'reconnected', refresh_token='new-refresh',
+            expiry=(timezone.now() + timedelta(hours=1)).replace(tzinfo=None)
+        ))
+        self.assertEqual(self.google_service.get_credentials_from_user(self.user).token, 'reconnected')
+
+
+class GoogleCredentialsRefreshTests(TransactionTestCase):
+    # Threads use their own connections, so the rows must be committed.
+    def setUp(self):
+        self.user = User.objects.create_user(username='single-flight')
+        GoogleOAuthToken.objects.create(
+            user=self.user, access_token='access', refresh_token='refresh', expires_in=3600,
+            expires_at=timezone.now() - timedelta(minutes=1), scope='calendar',
+        )
+        self.google_service = GoogleCalendarService()
+        self.google_service.invalidate_credentials(self.user)
+        self.addCleanup(self.google_service.invalidate_credentials, self.user)
+
+    def test_concurrent_refreshes_call_the_token_endpoint_once(self):
+        calls = []
+        tokens = []
+
+        def refresh():
+            try:
+                tokens.append(self.google_service.refresh_credentials(self.user).token)
+            finally:
+                connection.close()
+
+        with mock.patch.object(Credentials, 'refresh', fake_token_refresh(delay=0.2, calls=calls)):
+            threads = [threading.Thread(target=refresh) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(calls, ['refresh'])
+        self.assertEqual(tokens, ['refreshed'] * 5)
+
+    def test_processes_share_one_refresh_through_the_lease(self):
+        calls = []
+        tokens = []
+
+        def refresh():
+            # A fresh lock per caller, as if each ran in its own process.
+            try:
+                with mock.patch('calendar_api.services._get_refresh_lock', lambda user_id: threading.Lock()):
+                    tokens.append(GoogleCalendarService().refresh_credentials(self.user).token)
+            finally:
+                connection.close()
+
+        with mock.patch.object(Credentials, 'refresh', fake_token_refresh(delay=0.2, calls=calls)):
+            threads = [threading.Thread(target=refresh) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(calls, ['refresh'])
+        self.assertEqual(tokens, ['refreshed'] * 3)
+        self.assertIsNone(GoogleOAuthToken.objects.get(user=self.user).refreshing_until)
+
+    def test_waits_for_the_process_holding_the_lease(self):
+        GoogleOAuthToken.objects.filter(user=self.user).update(refreshing_until=timezone.now() + timedelta(seconds=30))
+
+        def other_process():
+            # Saves its refresh over its own connection a little later.
+            time.sleep(0.2)
+            GoogleOAuthToken.objects.filter(user=self.user).update(
+                access_token='other-process', expires_at=timezone.now() + timedelta(hours=1), refreshing_until=None
+            )
+            connection.close()
+
+        calls = []
+        thread = threading.Thread(target=other_process)
+        thread.start()
+        with mock.patch.object(Credentials, 'refresh', fake_token_refresh(calls=calls)):
+            credentials = self.google_service.refresh_credentials(self.user)
+        thread.join()
+        self.assertEqual(calls, [])
+        self.assertEqual(credentials.token, 'other-process')
+
+    def test_expired_lease_is_taken_over(self):
+        # Its holder died without releasing it.
+        GoogleOAuthToken.objects.filter(user=self.user).update(refreshing_until=timezone.now() - timedelta(seconds=1))
+        calls = []
+        with mock.patch.object(Credentials, 'refresh', fake_token_refresh(calls=calls)):
+            self.assertEqual(self.google_service.refresh_credentials(self.user).token, 'refreshed')
+        self.assertEqual(calls, ['refresh'])
+
+    def test_failed_refresh_releases_the_lease(self):
+        def unavailable(credentials, request):
+            raise RefreshError('temporarily unavailable')
+
+        with mock.patch.object(Credentials, 'refresh', unavailable), self.assertRaises(RefreshError):
+            self.google_service.refresh_credentials(self.user)
+        token = GoogleOAuthToken.objects.get(user=self.user)
+        self.assertIsNone(token.refreshing_until)
+        self.assertIsNone(token.invalid_at)
+
+    def test_token_endpoint_is_called_outside_a_transaction(self):
+        in_atomic = []
+
+        def refresh(credentials, request):
+            in_atomic.append(connection.in_atomic_block)
+            fake_token_refresh()(credentials, request)
+
+        with mock.patch.object(Credentials, 'refresh', refresh):
+            self.google_service.refresh_credentials(self.user)
+        self.assertEqual(in_atomic, [False])
+
+
+class GoogleServiceCacheTests(TestCase):
+    def setUp(self):
+        google_api._discovery_documents.clear()
+        google_api._service_cache.clear()
+        self.addCleanup(google_api._service_cache.clear)
+
+    def test_discovery_document_is_loaded_once(self):
+        with mock.patch.object(
+            google_api.discovery_cache, 'get_static_doc', wraps=google_api.discovery_cache.get_static_doc
+        ) as get_static_doc:
+            first = google_api.get_discovery_document('calendar', 'v3')
+            second = google_api.get_discovery_document('calendar', 'v3')
+        self.assertIs(first, second)
+        get_static_doc.assert_called_once_with('calendar', 'v3')
+
+    def test_services_are_reused_until_the_token_changes(self):
+        service = google_api.get_user_service(1, Credentials('token-a'))
+        self.assertIs(google_api.get_user_service(1, Credentials('token-a')), service)
+        refreshed = google_api.get_user_service(1, Credentials('token-b'))
+        self.assertIsNot(refreshed, service)
+        self.assertIs(google_api.get_user_service(1, Credentials('token-b')), refreshed)
+
+        google_api.evict_user_services(1)
+        self.assertIsNot(google_api.get_user_service(1, Credentials('token-b')), refreshed)
+
+    def test_revoking_access_evicts_the_users_services(self):
+        user = User.objects.create_user(username='revoked')
+        GoogleOAuthToken.objects.create(
+            user=user, access_token='token', refresh_token='r', expires_in=3600,
+            expires_at=timezone.now() + timedelta(hours=1), scope='calendar',
+        )
+        service = google_api.get_user_service(user.id, Credentials('token'))
+        other = google_api.get_user_service(user.id + 1, Credentials('token'))
+
+        self.assertTrue(AuthenticationService().revoke_google_access(user))
+        self.assertNotIn((user.id, 'calendar', 'v3'), google_api._service_cache)
+        self.assertIsNot(google_api.get_user_service(user.id, Credentials('token')), service)
+        self.assertIs(google_api.get_user_service(user.id + 1, Credentials('token')), other)
+
+    @override_settings(GOOGLE_SERVICE_CACHE_SIZE=2)
+    def test_least_recently_used_service_is_evicted(self):
+        services = {user_id: google_api.get_user_service(user_id, Credentials('token')) for user_id in (1, 2)}
+        google_api.get_user_service(1, Credentials('token'))
+        google_api.get_user_service(3, Credentials('token'))
+        self.assertIs(google_api.get_user_service(1, Credentials('token')), services[1])
+        self.assertIsNot(google_api.get_user_service(2, Credentials('token')), services[2])
+
+
+class TokenBucketTests(TestCase):
+    def test_limits_rate_after_burst(self):
+        bucket = google_api.TokenBucket(rate=50, capacity=5)
+        started = time.perf_counter()
+        for _ in range(15):
+            bucket.acquire()
+        # The first 5 are the burst; the other 10 need 10 / 50 = 0.2s.
+        self.assertGreaterEqual(time.perf_counter() - started, 0.18)
+
+
+def google_error(status, reason, message='error'):
+    return {'status': str(status)}, json.dumps({'error': {
+        'code': status, 'message': message, 'errors': [{'reason': reason, 'message': message}]
+    }})
+
+
+@override_settings(GOOGLE_API_BACKOFF_BASE=0.001, GOOGLE_API_BACKOFF_MAX=0.01, GOOGLE_API_MAX_RETRIES=5)
+class GoogleAPIRetryTests(TestCase):
+    def setUp(self):
+        google_api.reset_limits()
+        google_api.set_background_retries()
+        self.addCleanup(google_api.reset_limits)
+        self.user = User.objects.create_user(username='retry')
+
+    def service(self, responses):
+        # A real service on the bundled discovery document, talking to a
+        # local fake transport.
+        http = HttpMockSequence(responses)
+        return build_from_document(google_api.get_discovery_document('calendar', 'v3'), http=http), http
+
+    def test_retries_quota_and_server_errors(self):
+        service, http = self.service([
+            google_error(403, 'rateLimitExceeded'),
+            google_error(429, 'rateLimitExceeded'),
+            google_error(503, 'backendError'),
+            ({'status': '200'}, json.dumps({'id': 'e1'})),
+        ])
+        response = google_api.execute(service.events().get(calendarId='primary', eventId='e1'))
+        self.assertEqual(response, {'id': 'e1'})
+        self.assertEqual(len(http._iterable), 0)
+        # Quota errors slow the project-wide bucket down.
+        self.assertLess(google_api.get_rate_limiter().rate, settings.GOOGLE_API_RATE_LIMIT)
+
+    def test_user_quota_errors_slow_only_that_user(self):
+        service, http = self.service([
+            google_error(403, 'userRateLimitExceeded'),
+            ({'status': '200'}, '{}'),
+        ])
+        google_api.execute(service.events().get(calendarId='primary', eventId='e1'), user_id=self.user.id)
+        self.assertLess(google_api.get_user_rate_limiter(self.user.id).rate, settings.GOOGLE_API_USER_RATE_LIMIT)
+        self.assertEqual(google_api.get_rate_limiter().rate, settings.GOOGLE_API_RATE_LIMIT)
+
+    @override_settings(GOOGLE_API_MAX_RETRIES=3, GOOGLE_API_CIRCUIT_THRESHOLD=2)
+    def test_quota_errors_do_not_open_the_circuit(self):
+        service, http = self.service([google_error(403, 'userRateLimitExceeded'), google_error(429, 'rateLimitExceeded')] * 2)
+        with self.assertRaises(HttpError):
+            google_api.execute(service.events().get(calendarId='primary', eventId='e1'), user_id=self.user.id)
+        self.assertFalse(google_api._circuit_breaker.is_open)
+
+    @override_settings(GOOGLE_API_REQUEST_MAX_RETRIES=1, GOOGLE_API_REQUEST_RETRY_BUDGET=1)
+    def test_request_path_retries_are_short(self):
+        google_api.set_background_retries(False)
+        service, http = self.service([google_error(503, 'backendError')] * 3)
+        with self.assertRaises(HttpError):
+            google_api.execute(service.events().get(calendarId='primary', eventId='e1'))
+        self.assertEqual(len(http._iterable), 1)
+
+        # A Retry-After beyond the budget is not waited out.
+        headers, content = google_error(429, 'rateLimitExceeded')
+        service, http = self.service([(dict(headers, **{'retry-after': '5'}), content), ({'status': '200'}, '{}')])
+        with self.assertRaises(HttpError):
+            google_api.execute(service.events().get(calendarId='primary', eventId='e1'))
+        self.assertEqual(len(http._iterable), 1)
+
+    def test_client_errors_are_not_retried(self):
+        service, http = self.service([
+            google_error(403, 'forbidden'),
+            ({'status': '200'}, '{}'),
+        ])
+        with self.assertRaises(HttpError):
+            google_api.execute(service.events().get(calendarId='primary', eventId='e1'))
+        self.assertEqual(len(http._iterable), 1)
+
+    @override_settings(GOOGLE_API_MAX_RETRIES=2)
+    def test_gives_up_after_max_retries(self):
+        service, http = self.service([google_error(500, 'backendError')] * 4)
+        with self.assertRaises(HttpError):
+            google_api.execute(service.events().get(calendarId='primary', eventId='e1'))
+        self.assertEqual(len(http._iterable), 1)
+
+    @override_settings(GOOGLE_API_MAX_RETRIES=0, GOOGLE_API_CIRCUIT_THRESHOLD=2, GOOGLE_API_CIRCUIT_RESET=0.05)
+    def test_circuit_opens_then_half_opens(self):
+        service, http = self.service([
+            google_error(500, 'backendError'),
+            google_error(502, 'backendError'),
+            ({'status': '200'}, '{}'),
+        ])
+        for _ in range(2):
+            with self.assertRaises(HttpError):
+                google_api.execute(service.events().get(calendarId='primary', eventId='e1'))
+        # Open: fails fast without calling Google.
+        with self.assertRaises(google_api.GoogleAPIUnavailable):
+            google_api.execute(service.events().get(calendarId='primary', eventId='e1'))
+        self.assertEqual(len(http._iterable), 1)
+
+        time.sleep(0.06)
+        self.assertEqual(google_api.execute(service.events().get(calendarId='primary', eventId='e1')), {})
+        self.assertFalse(google_api._circuit_breaker.is_open)
+
+    @override_settings(GOOGLE_API_MAX_RETRIES=0, GOOGLE_API_CIRCUIT_THRESHOLD=1, GOOGLE_API_CIRCUIT_RESET=60)
+    def test_open_circuit_returns_503(self):
+        service, http = self.service([google_error(500, 'backendError')])
+        with self.assertRaises(HttpError):
+            google_api.execute(service.events().get(calendarId='primary', eventId='e1'))
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch.object(GoogleCalendarService, 'get_calendar_service', return_value=service):
+            response = client.get('/api/calendars/', {'refresh': 1})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '60')
+
+    def test_retried_insert_keeps_its_id(self):
+        service, http = self.service([
+            google_error(503, 'backendError'),
+            # The first attempt had gone through after all.
+            google_error(409, 'duplicate'),
+            ({'status': '200'}, json.dumps({'id': 'fetched'})),
+        ])
+        start = datetime(2025, 3, 3, 10, tzinfo=dt_timezone.utc)
+        with mock.patch.object(GoogleCalendarService, 'get_calendar_service', return_value=service):
+            event = GoogleCalendarService().create_event(self.user, {
+                'title': 'Planning', 'start_datetime': start, 'end_datetime': start + timedelta(hours=1),
+            })
+        self.assertEqual(event, {'id': 'fetched'})
+        self.assertEqual(len(http._iterable), 0)
+
+    def test_delete_treats_missing_event_as_deleted(self):
+        service, http = self.service([
+            google_error(410, 'deleted'),
+            google_error(404, 'notFound'),
+        ])
+        google_service = GoogleCalendarService()
+        with mock.patch.object(GoogleCalendarService, 'get_calendar_service', return_value=service):
+            self.assertTrue(google_service.delete_event(self.user, 'gone'))
+            self.assertTrue(google_service.delete_event(self.user, 'missing'))
+
+        service, http = self.service([google_error(400, 'invalid')])
+        with mock.patch.object(GoogleCalendarService, 'get_calendar_service', return_value=service):
+            with self.assertRaises(HttpError):
+                google_service.delete_event(self.user, 'bad')
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpPoolTests(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        self.server.connections = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        self.pool = google_api.HttpPool(size=2, idle_timeout=60)
+        self.addCleanup(self.pool.close)
+
+    def test_requests_reuse_one_connection(self):
+        http = google_api.PooledHttp(self.pool)
+        for _ in range(5):
+            response, content = http.request(self.url)
+            self.assertEqual(response.status, 200)
+        self.assertEqual(self.server.connections, 1)
+
+        # An authorized client on the same pool rides the same connection.
+        with mock.patch.object(google_api, '_http_pool', self.pool):
+            response, content = google_api.authorized_http(Credentials('token')).request(self.url)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_concurrent_requests_use_separate_transports(self):
+        transports = [self.pool.acquire() for _ in range(3)]
+        self.assertEqual(len({id(http) for http in transports}), 3)
+        for http in transports:
+            self.pool.release(http)
+        # Only ``size`` idle transports are kept.
+        self.assertEqual(len(self.pool.idle), 2)
+        self.assertIs(self.pool.acquire(), transports[1])
+
+    def test_idle_transports_expire(self):
+        self.pool.idle_timeout = 0.05
+        http = self.pool.acquire()
+        http.request(self.url)
+        self.pool.release(http)
+        time.sleep(0.06)
+
+        self.assertIsNot(self.pool.acquire(), http)
+        self.assertEqual(http.connections, {})
+
+    def test_services_use_the_pool(self):
+        service = google_api.build_service('calendar', 'v3', Credentials('token'))
+        self.assertIsInstance(service._http.http, google_api.PooledHttp)
@@ -3,7 +3,13 @@ from . import views
 
 urlpatterns = [
     path('events/', views.EventListCreateView.as_view(), name='event_list_create'),
+    path('events/export/', views.export_events, name='event_export'),
+    path('events/ics/', views.events_ics, name='event_ics'),
+    path('events/bulk/', views.BulkEventView.as_view(), name='event_bulk'),
     path('events/<int:pk>/', views.EventDetailView.as_view(), name='event_detail'),
+    path('freebusy/', views.freebusy, name='freebusy'),
     path('sync/', views.sync_events, name='sync_events'),
+    path('watch/', views.watch_calendar, name='watch_calendar'),
+    path('webhooks/google/', views.google_webhook, name='google_webhook'),
     path('calendars/', views.list_calendars, name='list_calendars'),
 ]
\ No newline at end of file
@@ -1,59 +1,141 @@
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status, generics
 from rest_framework.views import APIView
 from django.utils.dateparse import parse_datetime
 from django.utils import timezone
-from datetime import datetime, timedelta
-from .models import CalendarEvent
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from .exports import EXPORT_CONTENT_TYPES, stream_events
+from .freebusy import busy_intervals, merge_intervals
+from .google_api import GoogleAPIUnavailable
+from .ics import ICSParseError, import_events, stream_ics
+from .models import CalendarEvent, CalendarEventBucket, GoogleOutboxEntry, GoogleWatchChannel
+from .pagination import EventKeysetPagination
+from .recurrence import expand_event_rows
+from .outbox import enqueue_event_push, enqueue_event_pushes
 from .services import GoogleCalendarService
-from .serializers import CalendarEventSerializer, CalendarEventCreateSerializer
+from .watch import WatchError, handle_notification, start_watch, stop_watch
+from .serializers import (
+    CalendarEventSerializer, CalendarEventCreateSerializer, BulkEventOperationSerializer,
+    EVENT_ROW_FIELDS, serialize_event_rows
+)
+from users.serializers import UserSerializer
+import hashlib
 import json
 
+google_service = GoogleCalendarService()
+
+def event_window(params):
+    start_date = params.get('start')
+    end_date = params.get('end')
+    
+    start_dt = parse_datetime(start_date) if start_date else None
+    end_dt = parse_datetime(end_date) if end_date else None
+    # Values without an offset are read as UTC, so callers comparing against
+    # stored (aware) datetimes never mix naive and aware values.
+    if start_dt and timezone.is_naive(start_dt):
+        start_dt = timezone.make_aware(start_dt, dt_timezone.utc)
+    if end_dt and timezone.is_naive(end_dt):
+        end_dt = timezone.make_aware(end_dt, dt_timezone.utc)
+    return start_dt, end_dt, params.get('mode') == 'overlap'
+
+def filter_events(user, params):
+    calendar_id = params.get('calendar_id')
+    start_dt, end_dt, overlap = event_window(params)
+    
+    if overlap and start_dt and end_dt:
+        # Every event intersecting the window, including ones that
+        # began before it; overlapping() already scopes to the user.
+        queryset = CalendarEvent.objects.overlapping(user, start_dt, end_dt)
+    else:
+        queryset = CalendarEvent.objects.filter(user=user)
+    
+    if calendar_id:
+        queryset = queryset.filter(calendar_id=calendar_id)
+    
+    if overlap:
+        if start_dt and end_dt:
+            return queryset.order_by('start_datetime')
+        if start_dt:
+            queryset = queryset.filter(end_datetime__gt=start_dt)
+        if end_dt:
+            queryset = queryset.filter(start_datetime__lt=end_dt)
+        return queryset.order_by('start_datetime')
+    
+    if start_dt:
+        queryset = queryset.filter(start_datetime__gte=start_dt)
+    
+    if end_dt:
+        queryset = queryset.filter(start_datetime__lte=end_dt)
+    
+    return queryset.order_by('start_datetime')
+
+def recurring_event_rows(user, params):
+    # Occurrences of recurring events in the requested window, expanded
+    # locally. None when the listing has no closed window to expand into.
+    start_dt, end_dt, overlap = event_window(params)
+    if not (start_dt and end_dt):
+        return None
+    
+    masters = CalendarEvent.objects.filter(
+        user=user, start_datetime__lte=end_dt, recurrence_rule__gt=''
+    )
+    calendar_id = params.get('calendar_id')
+    if calendar_id:
+        masters = masters.filter(calendar_id=calendar_id)
+    return expand_event_rows(masters.values_list(*EVENT_ROW_FIELDS), start_dt, end_dt, overlap)
+
+def event_list_etag(request, *args, **kwargs):
+    # Changes whenever one of the user's events is created, edited, synced
+    # or deleted. Read from the (user, updated_at, last_synced_at) index, so a
+    # matching If-None-Match costs this one query and nothing else.
+    stats = CalendarEvent.objects.filter(user=request.user).aggregate(
+        count=Count('id'), updated=Max('updated_at'), synced=Max('last_synced_at')
+    )
+    user = request.user
+    key = '|'.join(str(value) for value in (
+        user.pk, user.username, user.email, user.first_name, user.last_name,
+        stats['count'], stats['updated'], stats['synced'], request.get_full_path()
+    ))
+    return hashlib.sha256(key.encode()).hexdigest()
+
 class EventListCreateView(generics.ListCreateAPIView):
     serializer_class = CalendarEventSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = EventKeysetPagination
+    
+    @method_decorator(condition(etag_func=event_list_etag))
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        occurrences = recurring_event_rows(request.user, request.query_params)
+        if occurrences is not None:
+            # Recurring events are listed through their occurrences instead.
+            queryset = queryset.filter(Q(recurrence_rule__isnull=True) | Q(recurrence_rule=''))
+        page = self.paginator.paginate_queryset(
+            queryset.values_list(*EVENT_ROW_FIELDS), request, view=self, extra_rows=occurrences or ()
+        )
+        response = self.get_paginated_response(serialize_event_rows(page))
+        response.data['user'] = UserSerializer(request.user).data
+        return response
     
     def get_queryset(self):
-        user = self.request.user
-        queryset = CalendarEvent.objects.filter(user=user)
-        
-        start_date = self.request.query_params.get('start')
-        end_date = self.request.query_params.get('end')
-        
-        if start_date:
-            start_dt = parse_datetime(start_date)
-            if start_dt:
-                queryset = queryset.filter(start_datetime__gte=start_dt)
-        
-        if end_date:
-            end_dt = parse_datetime(end_date)
-            if end_dt:
-                queryset = queryset.filter(start_datetime__lte=end_dt)
-        
-        return queryset.order_by('start_datetime')
+        return filter_events(self.request.user, self.request.query_params)
     
     def perform_create(self, serializer):
-        google_service = GoogleCalendarService()
-        event = serializer.save(user=self.request.user)
-        
-        event_data = {
-            'title': event.title,
-            'description': event.description,
-            'start_datetime': event.start_datetime,
-            'end_datetime': event.end_datetime,
-            'location': event.location,
-            'is_all_day': event.is_all_day,
-            'calendar_id': event.calendar_id,
-        }
-        
-        google_event = google_service.create_event(self.request.user, event_data)
-        if google_event:
-            event.google_event_id = google_event['id']
-            event.synced_with_google = True
-            event.last_synced_at = timezone.now()
-            event.save()
+        # Google is updated by the outbox worker (manage.py push_google_outbox)
+        # once the local write has committed.
+        with transaction.atomic():
+            event = serializer.save(user=self.request.user)
+            enqueue_event_push(event, GoogleOutboxEntry.CREATE)
 
 class EventDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CalendarEventSerializer
@@ -63,60 +145,252 @@ class EventDetailView(generics.RetrieveUpdateDestroyAPIView):
         return CalendarEvent.objects.filter(user=self.request.user)
     
     def perform_update(self, serializer):
-        google_service = GoogleCalendarService()
-        event = serializer.save()
-        
-        if event.google_event_id:
-            event_data = {
-                'title': event.title,
-                'description': event.description,
-                'start_datetime': event.start_datetime,
-                'end_datetime': event.end_datetime,
-                'location': event.location,
-                'is_all_day': event.is_all_day,
-            }
-            
-            google_event = google_service.update_event(
-                self.request.user,
-                event.google_event_id,
-                event_data,
-                event.calendar_id
-            )
-            if google_event:
-                event.synced_with_google = True
-                event.last_synced_at = timezone.now()
-                event.save()
+        with transaction.atomic():
+            event = serializer.save(synced_with_google=False)
+            enqueue_event_push(event, GoogleOutboxEntry.UPDATE)
     
     def perform_destroy(self, instance):
-        google_service = GoogleCalendarService()
-        if instance.google_event_id:
-            google_service.delete_event(
-                self.request.user,
-                instance.google_event_id,
-                instance.calendar_id
-            )
-        instance.delete()
+        with transaction.atomic():
+            enqueue_event_push(instance, GoogleOutboxEntry.DELETE)
+            instance.delete()
+
+class BulkEventView(APIView):
+    permission_classes = [IsAuthenticated]
+    MAX_OPERATIONS = 1000
+    
+    def post(self, request):
+        serializer = BulkEventOperationSerializer(
+            data=request.data, many=True, max_length=self.MAX_OPERATIONS
+        )
+        if not serializer.is_valid():
+            return Response({
+                'error': 'Invalid bulk operations',
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        operations = serializer.validated_data
+        target_ids = [op['id'] for op in operations if op['op'] != BulkEventOperationSerializer.CREATE]
+        events = CalendarEvent.objects.filter(user=request.user).in_bulk(target_ids)
+        
+        errors = [{} for _ in operations]
+        seen_ids = set()
+        for index, op in enumerate(operations):
+            if op['op'] == BulkEventOperationSerializer.CREATE:
+                continue
+            if op['id'] not in events:
+                errors[index] = {'id': 'Event not found.'}
+            elif op['id'] in seen_ids:
+                errors[index] = {'id': 'Event appears in more than one operation.'}
+            seen_ids.add(op['id'])
+        
+        if any(errors):
+            return Response({
+                'error': 'Invalid bulk operations',
+                'errors': errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        with transaction.atomic():
+            results = self.apply_operations(request.user, operations, events)
+        
+        return Response({
+            'results': results,
+            'count': len(results)
+        })
+    
+    def apply_operations(self, user, operations, events):
+        now = timezone.now()
+        created = []
+        updated = []
+        deleted = []
+        moved = []
+        update_fields = {'synced_with_google', 'updated_at'}
+        
+        for op in operations:
+            if op['op'] == BulkEventOperationSerializer.CREATE:
+                created.append(CalendarEvent(user=user, **op['data']))
+            elif op['op'] == BulkEventOperationSerializer.UPDATE:
+                event = events[op['id']]
+                for name, value in op['data'].items():
+                    setattr(event, name, value)
+                update_fields.update(op['data'])
+                # bulk_update bypasses save(), so auto_now is applied by hand.
+                event.synced_with_google = False
+                event.updated_at = now
+                updated.append(event)
+                if {'start_datetime', 'end_datetime'} & set(op['data']):
+                    moved.append(event)
+            else:
+                deleted.append(events[op['id']])
+        
+        created = CalendarEvent.objects.bulk_create(created)
+        if updated:
+            CalendarEvent.objects.bulk_update(updated, sorted(update_fields))
+        CalendarEventBucket.rebuild_for(created + moved)
+        
+        enqueue_event_pushes(created, GoogleOutboxEntry.CREATE)
+        enqueue_event_pushes(updated, GoogleOutboxEntry.UPDATE)
+        enqueue_event_pushes(deleted, GoogleOutboxEntry.DELETE)
+        
+        deleted_ids = [event.pk for event in deleted]
+        if deleted_ids:
+            CalendarEvent.objects.filter(pk__in=deleted_ids).delete()
+        
+        results = []
+        created_iter = iter(created)
+        for op in operations:
+            if op['op'] == BulkEventOperationSerializer.CREATE:
+                results.append({'op': op['op'], 'id': next(created_iter).pk, 'status': 'created'})
+            elif op['op'] == BulkEventOperationSerializer.UPDATE:
+                results.append({'op': op['op'], 'id': op['id'], 'status': 'updated'})
+            else:
+                results.append({'op': op['op'], 'id': op['id'], 'status': 'deleted'})
+        return results
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_events(request):
+    output = request.query_params.get('output', 'json')
+    if output not in EXPORT_CONTENT_TYPES:
+        return Response({
+            'error': f"Invalid output '{output}', expected one of: {', '.join(EXPORT_CONTENT_TYPES)}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Same filters as /api/events/, in a stable order, without paging.
+    queryset = filter_events(request.user, request.query_params).order_by('start_datetime', 'id')
+    response = StreamingHttpResponse(
+        stream_events(queryset, output, settings.EVENTS_EXPORT_CHUNK_SIZE),
+        content_type=EXPORT_CONTENT_TYPES[output]
+    )
+    response['Content-Disposition'] = f'attachment; filename="events.{output}"'
+    return response
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def events_ics(request):
+    if request.method == 'GET':
+        queryset = filter_events(request.user, request.query_params).order_by('start_datetime', 'id')
+        response = StreamingHttpResponse(
+            stream_ics(queryset, settings.EVENTS_EXPORT_CHUNK_SIZE),
+            content_type='text/calendar; charset=utf-8'
+        )
+        response['Content-Disposition'] = 'attachment; filename="events.ics"'
+        return response
+    
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({
+            'error': 'An .ics file is required in the "file" field'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        imported, skipped = import_events(
+            request.user,
+            upload,
+            calendar_id=request.data.get('calendar_id') or 'primary',
+            push=str(request.data.get('push', 'true')).lower() not in ('0', 'false'),
+        )
+    except ICSParseError as e:
+        return Response({
+            'error': f'Invalid iCalendar file: {str(e)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'imported': imported,
+        'skipped': skipped
+    }, status=status.HTTP_201_CREATED)
+
+def format_utc_datetime(value):
+    return value.astimezone(dt_timezone.utc).isoformat().replace('+00:00', 'Z')
+
+FREEBUSY_MAX_USERS = 50
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def freebusy(request):
+    start_dt, end_dt, _ = event_window(request.query_params)
+    if not (start_dt and end_dt) or end_dt <= start_dt:
+        return Response({
+            'error': 'start and end are required, with start before end'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        user_ids = [int(user_id) for user_id in request.query_params.get('users', '').split(',') if user_id]
+    except ValueError:
+        return Response({
+            'error': 'users must be a comma-separated list of user ids'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    user_ids = list(dict.fromkeys(user_ids)) or [request.user.id]
+    if len(user_ids) > FREEBUSY_MAX_USERS:
+        return Response({
+            'error': f'At most {FREEBUSY_MAX_USERS} users can be queried at once'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Users may see their own free/busy and that of users sharing one of
+    # their groups. Unknown and hidden users get the same answer so ids
+    # cannot be probed.
+    visible = set(
+        User.objects.filter(id__in=user_ids, groups__in=request.user.groups.all()).values_list('id', flat=True)
+    )
+    visible.add(request.user.id)
+    if not visible.issuperset(user_ids):
+        return Response({
+            'error': 'You do not have access to the free/busy information of all requested users'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    calendar_ids = [calendar_id for calendar_id in request.query_params.get('calendar_id', '').split(',') if calendar_id]
+    busy = busy_intervals(user_ids, start_dt, end_dt, calendar_ids)
+    
+    return Response({
+        'start': format_utc_datetime(start_dt),
+        'end': format_utc_datetime(end_dt),
+        'users': {
+            str(user_id): [[format_utc_datetime(s), format_utc_datetime(e)] for s, e in intervals]
+            for user_id, intervals in busy.items()
+        },
+        'busy': [
+            [format_utc_datetime(s), format_utc_datetime(e)]
+            for s, e in merge_intervals(interval for intervals in busy.values() for interval in intervals)
+        ]
+    })
+
+def google_unavailable_response(error):
+    # The circuit breaker is open; Google is not called until it resets.
+    return Response({
+        'error': str(error)
+    }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={
+        'Retry-After': str(int(settings.GOOGLE_API_CIRCUIT_RESET))
+    })
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_calendars(request):
     try:
-        google_service = GoogleCalendarService()
-        service = google_service.get_calendar_service(request.user)
+        refresh = str(request.query_params.get('refresh', '')).lower() in ('1', 'true')
+        calendar_list = google_service.get_calendar_list(request.user, refresh=refresh)
         
-        if not service:
+        if calendar_list is None:
             return Response({
                 'error': 'User not authenticated with Google'
             }, status=status.HTTP_401_UNAUTHORIZED)
         
-        calendar_list = service.calendarList().list().execute()
-        calendars = calendar_list.get('items', [])
+        # Google's own etag for the list; a match skips building the body.
+        etag = quote_etag(calendar_list['etag']) if calendar_list.get('etag') else None
+        if etag:
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return not_modified
         
-        return Response({
+        calendars = calendar_list.get('items', [])
+        response = Response({
             'calendars': calendars,
             'count': len(calendars)
         })
+        if etag:
+            response['ETag'] = etag
+        return response
         
+    except GoogleAPIUnavailable as e:
+        return google_unavailable_response(e)
     except Exception as e:
         return Response({
             'error': f'Failed to list calendars: {str(e)}'
@@ -126,25 +400,76 @@ def list_calendars(request):
 @permission_classes([IsAuthenticated])
 def sync_events(request):
     try:
-        synced_events = google_service.sync_events_from_google(request.user)
+        full_sync = str(request.data.get('full', '')).lower() in ('1', 'true')
+        
+        if str(request.data.get('all_calendars', '')).lower() in ('1', 'true'):
+            synced, errors = google_service.sync_all_calendars(request.user, full_sync=full_sync)
+            synced_count = sum(synced.values())
+            return Response({
+                'message': f'Successfully synced {synced_count} events from {len(synced) - len(errors)} Google calendars',
+                'synced_count': synced_count,
+                'calendars': synced,
+                'failed': {calendar_id: str(error) for calendar_id, error in errors.items()}
+            })
+        
+        synced_events = google_service.sync_events_from_google(request.user, full_sync=full_sync)
         
         return Response({
             'message': f'Successfully synced {len(synced_events)} events from Google Calendar',
             'synced_count': len(synced_events)
         })
         
+    except GoogleAPIUnavailable as e:
+        return google_unavailable_response(e)
     except Exception as e:
         return Response({
             'error': f'Failed to sync events: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def watch_calendar(request):
+    calendar_id = request.data.get('calendar_id') or request.query_params.get('calendar_id') or 'primary'
+    
+    try:
+        if request.method == 'DELETE':
+            for channel in GoogleWatchChannel.objects.filter(user=request.user, calendar_id=calendar_id):
+                stop_watch(channel, google_service)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        
+        channel = start_watch(request.user, calendar_id, google_service)
+        return Response({
+            'channel_id': channel.channel_id,
+            'calendar_id': channel.calendar_id,
+            'expiration': channel.expiration
+        }, status=status.HTTP_201_CREATED)
+        
+    except WatchError as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except GoogleAPIUnavailable as e:
+        return google_unavailable_response(e)
+    except Exception as e:
+        return Response({
+            'error': f'Failed to update calendar watch: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def google_webhook(request):
+    # Called by Google, authenticated by the channel token in the headers.
+    return Response(status=handle_notification(request.headers))
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def google_events(request):
     try:
         start_date = request.GET.get('start')
         end_date = request.GET.get('end')
-        max_results = int(request.GET.get('max_results', 100))
+        max_results = request.GET.get('max_results')
+        max_results = int(max_results) if max_results else None
         
         time_min = None
         time_max = None
@@ -166,6 +491,8 @@ def google_events(request):
             'count': len(google_events)
         })
         
+    except GoogleAPIUnavailable as e:
+        return google_unavailable_response(e)
     except Exception as e:
         return Response({
             'error': f'Failed to fetch Google events: {str(e)}'
@@ -0,0 +1,200 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+from googleapiclient.errors import HttpError
+from . import google_api
+from .models import GoogleWatchChannel
+from .services import GoogleCalendarService
+import hmac
+import secrets
+import threading
+import uuid
+
+# Google push notifications (events().watch). Google POSTs to the webhook
+# whenever a watched calendar changes; the notification carries no event
+# data, so it only triggers an incremental sync for that calendar.
+
+# (user id, calendar id) -> {'timer', 'running', 'rerun'} for a sync that is
+# scheduled or running. The key stays until the sync has finished.
+_pending_syncs = {}
+_pending_lock = threading.Lock()
+
+
+class WatchError(Exception):
+    pass
+
+
+def start_watch(user, calendar_id='primary', google_service=None):
+    # Replaces any existing channel for the calendar.
+    google_service = google_service or GoogleCalendarService()
+    if not settings.GOOGLE_WEBHOOK_URL:
+        raise WatchError('GOOGLE_WEBHOOK_URL is not configured')
+
+    service = google_service.get_calendar_service(user)
+    if not service:
+        raise WatchError('User not authenticated with Google')
+
+    channel = GoogleWatchChannel(
+        user=user,
+        calendar_id=calendar_id,
+        channel_id=uuid.uuid4().hex,
+        token=secrets.token_urlsafe(32),
+    )
+    response = google_api.execute(service.events().watch(calendarId=calendar_id, body={
+        'id': channel.channel_id,
+        'type': 'web_hook',
+        'address': settings.GOOGLE_WEBHOOK_URL,
+        'token': channel.token,
+        'params': {'ttl': str(settings.GOOGLE_WATCH_TTL)},
+    }), user_id=user.id)
+    channel.resource_id = response.get('resourceId')
+    if response.get('expiration'):
+        # Milliseconds since the epoch.
+        channel.expiration = datetime.fromtimestamp(int(response['expiration']) / 1000, tz=dt_timezone.utc)
+
+    previous = list(GoogleWatchChannel.objects.filter(user=user, calendar_id=calendar_id))
+    channel.save()
+    for old_channel in previous:
+        stop_watch(old_channel, google_service)
+    return channel
+
+
+def stop_watch(channel, google_service=None):
+    google_service = google_service or GoogleCalendarService()
+    service = google_service.get_calendar_service(channel.user)
+    if service and channel.resource_id:
+        try:
+            google_api.execute(service.channels().stop(body={
+                'id': channel.channel_id,
+                'resourceId': channel.resource_id,
+            }), user_id=channel.user_id)
+        except HttpError as e:
+            # Already expired or stopped on Google's side.
+            if e.resp.status != 404:
+                raise
+    channel.delete()
+
+
+def stop_user_watches(user, google_service=None):
+    for channel in GoogleWatchChannel.objects.filter(user=user).select_related('user'):
+        try:
+            stop_watch(channel, google_service)
+        except Exception as e:
+            print(f"Error stopping watch channel {channel.channel_id}: {e}")
+            channel.delete()
+
+
+def renew_expiring_watches(window, google_service=None):
+    # Google channels cannot be extended, only replaced before they expire.
+    google_service = google_service or GoogleCalendarService()
+    deadline = timezone.now() + timedelta(seconds=window)
+    renewed = 0
+    failed = 0
+    channels = GoogleWatchChannel.objects.filter(expiration__lte=deadline).select_related('user')
+    for channel in channels:
+        try:
+            start_watch(channel.user, channel.calendar_id, google_service)
+            renewed += 1
+        except Exception as e:
+            failed += 1
+            print(f"Error renewing watch channel {channel.channel_id}: {e}")
+    return renewed, failed
+
+
+def handle_notification(headers):
+    # Returns the HTTP status for the webhook response. Google only needs a
+    # fast 2xx; the sync itself runs later, off the request.
+    channel_id = headers.get('X-Goog-Channel-ID')
+    token = headers.get('X-Goog-Channel-Token') or ''
+    state = headers.get('X-Goog-Resource-State')
+    if not channel_id or not state:
+        return 400
+
+    channel = GoogleWatchChannel.objects.filter(channel_id=channel_id).first()
+    if channel is None:
+        return 404
+    if not hmac.compare_digest(channel.token, token):
+        return 403
+    if channel.resource_id and headers.get('X-Goog-Resource-ID') != channel.resource_id:
+        return 403
+
+    # 'sync' is the handshake sent when the channel is created.
+    if state != 'sync':
+        schedule_sync(channel.user_id, channel.calendar_id)
+    return 200
+
+
+def schedule_sync(user_id, calendar_id):
+    # Debounced per calendar: the first notification schedules a sync
+    # GOOGLE_WATCH_DEBOUNCE seconds out and later ones ride along with it,
+    # so a burst of changes costs one incremental sync. Notifications that
+    # arrive while the sync runs set a flag for one more sync afterwards.
+    key = (user_id, calendar_id)
+    with _pending_lock:
+        pending = _pending_syncs.get(key)
+        if pending:
+            if pending['running']:
+                pending['rerun'] = True
+            return False
+        timer = _start_timer(key)
+    timer.start()
+    return True
+
+
+def _start_timer(key):
+    # Called with _pending_lock held; the caller starts the timer.
+    timer = threading.Timer(settings.GOOGLE_WATCH_DEBOUNCE, _run_sync, args=key)
+    timer.daemon = True
+    _pending_syncs[key] = {'timer': timer, 'running': False, 'rerun': False}
+    return timer
+
+
+def _run_sync(user_id, calendar_id):
+    key = (user_id, calendar_id)
+    with _pending_lock:
+        _pending_syncs[key]['running'] = True
+    try:
+        user = User.objects.get(pk=user_id)
+        GoogleCalendarService().sync_events_from_google(user, calendar_id)
+    except Exception as e:
+        print(f"Error syncing calendar {calendar_id} for user {user_id}: {e}")
+    finally:
+        close_old_connections()
+
+    timer = None
+    with _pending_lock:
+        if _pending_syncs[key]['rerun']:
+            timer = _start_timer(key)
+        else:
+            del _pending_syncs[key]
+    if timer:
+        timer.start()
+
+
+def wait_for_pending_syncs():
+    # A finished sync may schedule a re-run, so wait until none are left.
+    while True:
+        with _pending_lock:
+            timers = [pending['timer'] for pending in _pending_syncs.values()]
+        if not timers:
+            return
+        for timer in timers:
+            timer.join()
+
+
+def notification_headers(channel, state='exists', message_number=1):
+    # The headers Google sends for a notification on ``channel``; used by
+    # the fake notifier to exercise the webhook without Google.
+    headers = {
+        'X-Goog-Channel-ID': channel.channel_id,
+        'X-Goog-Channel-Token': channel.token,
+        'X-Goog-Resource-State': state,
+        'X-Goog-Message-Number': str(message_number),
+    }
+    if channel.resource_id:
+        headers['X-Goog-Resource-ID'] = channel.resource_id
+    if channel.expiration:
+        headers['X-Goog-Channel-Expiration'] = channel.expiration.strftime('%a, %d %b %Y %H:%M:%S GMT')
+    return headers
@@ -83,6 +83,25 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # SQLite allows one writer at a time; sync_all workers and the outbox
+        # worker wait this many seconds for the lock instead of failing with
+        # "database is locked".
+        'OPTIONS': {
+            'timeout': config('SQLITE_TIMEOUT', default=30, cast=int),
+        },
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Per-process memory by default; point CACHE_BACKEND/CACHE_LOCATION at a
+# shared cache (e.g. Redis or Memcached) when running several processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='google-calendar-backend'),
     }
 }
 
@@ -182,3 +201,81 @@ CORS_PREFLIGHT_MAX_AGE = 86400
 GOOGLE_OAUTH2_CLIENT_ID = config('GOOGLE_CLIENT_ID')
 GOOGLE_OAUTH2_CLIENT_SECRET = config('GOOGLE_CLIENT_SECRET')
 GOOGLE_OAUTH2_REDIRECT_URI = config('GOOGLE_REDIRECT_URI')
+
+# Google Calendar sync settings
+# Days ahead covered by a full sync; incremental syncs reuse the stored syncToken.
+GOOGLE_SYNC_WINDOW_DAYS = config('GOOGLE_SYNC_WINDOW_DAYS', default=30, cast=int)
+
+# Calendars fetched concurrently by a multi-calendar sync (POST /api/sync/ with all_calendars).
+GOOGLE_SYNC_WORKERS = config('GOOGLE_SYNC_WORKERS', default=4, cast=int)
+
+# `manage.py sync_all`: worker processes, Google API requests per second shared by
+# all of them (the project quota), and where an interrupted pass is checkpointed.
+# Outside sync_all GOOGLE_API_RATE_LIMIT applies to each process on its own.
+GOOGLE_SYNC_PROCESSES = config('GOOGLE_SYNC_PROCESSES', default=4, cast=int)
+GOOGLE_API_RATE_LIMIT = config('GOOGLE_API_RATE_LIMIT', default=10, cast=float)
+GOOGLE_SYNC_CHECKPOINT = config('GOOGLE_SYNC_CHECKPOINT', default=str(BASE_DIR / 'sync_all.checkpoint.json'))
+
+# Every Google API call: per-user requests per second on top of the per-process
+# GOOGLE_API_RATE_LIMIT (0 disables either), retries with exponential backoff and
+# jitter on quota errors, 429 and 5xx, and a circuit breaker that fails fast for
+# GOOGLE_API_CIRCUIT_RESET seconds after GOOGLE_API_CIRCUIT_THRESHOLD straight failures.
+# Web processes keep retries short (GOOGLE_API_REQUEST_*) since a request is waiting;
+# GOOGLE_API_MAX_RETRIES applies to the background management commands.
+GOOGLE_API_USER_RATE_LIMIT = config('GOOGLE_API_USER_RATE_LIMIT', default=5, cast=float)
+GOOGLE_API_MAX_RETRIES = config('GOOGLE_API_MAX_RETRIES', default=5, cast=int)
+GOOGLE_API_REQUEST_MAX_RETRIES = config('GOOGLE_API_REQUEST_MAX_RETRIES', default=2, cast=int)
+GOOGLE_API_REQUEST_RETRY_BUDGET = config('GOOGLE_API_REQUEST_RETRY_BUDGET', default=3, cast=float)
+GOOGLE_API_BACKOFF_BASE = config('GOOGLE_API_BACKOFF_BASE', default=1, cast=float)
+GOOGLE_API_BACKOFF_MAX = config('GOOGLE_API_BACKOFF_MAX', default=32, cast=float)
+GOOGLE_API_CIRCUIT_THRESHOLD = config('GOOGLE_API_CIRCUIT_THRESHOLD', default=10, cast=int)
+GOOGLE_API_CIRCUIT_RESET = config('GOOGLE_API_CIRCUIT_RESET', default=30, cast=float)
+
+# Users whose built Google API service objects and credentials are kept in memory (LRU).
+GOOGLE_SERVICE_CACHE_SIZE = config('GOOGLE_SERVICE_CACHE_SIZE', default=256, cast=int)
+
+# Keep-alive connections to Google shared by every request in a process: at most
+# GOOGLE_HTTP_POOL_SIZE idle transports are kept, each for up to GOOGLE_HTTP_IDLE_TIMEOUT seconds.
+GOOGLE_HTTP_POOL_SIZE = config('GOOGLE_HTTP_POOL_SIZE', default=10, cast=int)
+GOOGLE_HTTP_IDLE_TIMEOUT = config('GOOGLE_HTTP_IDLE_TIMEOUT', default=60, cast=float)
+
+# Cached Google calendar lists: fresh for GOOGLE_CALENDAR_LIST_TTL seconds, then
+# served stale for up to GOOGLE_CALENDAR_LIST_STALE more while refreshed in the background.
+GOOGLE_CALENDAR_LIST_TTL = config('GOOGLE_CALENDAR_LIST_TTL', default=300, cast=int)
+GOOGLE_CALENDAR_LIST_STALE = config('GOOGLE_CALENDAR_LIST_STALE', default=3600, cast=int)
+
+# Push notifications (events().watch). GOOGLE_WEBHOOK_URL is the public HTTPS
+# address of /api/webhooks/google/; channels last GOOGLE_WATCH_TTL seconds and are
+# renewed by `manage.py renew_google_watches`. Notifications for a calendar
+# within GOOGLE_WATCH_DEBOUNCE seconds share one incremental sync.
+GOOGLE_WEBHOOK_URL = config('GOOGLE_WEBHOOK_URL', default='')
+GOOGLE_WATCH_TTL = config('GOOGLE_WATCH_TTL', default=604800, cast=int)
+GOOGLE_WATCH_RENEW_WINDOW = config('GOOGLE_WATCH_RENEW_WINDOW', default=86400, cast=int)
+GOOGLE_WATCH_DEBOUNCE = config('GOOGLE_WATCH_DEBOUNCE', default=5, cast=float)
+
+# Tokens expiring within this many seconds are renewed by `manage.py refresh_google_tokens`.
+GOOGLE_TOKEN_REFRESH_WINDOW = config('GOOGLE_TOKEN_REFRESH_WINDOW', default=600, cast=int)
+# Seconds one process may hold a token refresh before another takes over.
+GOOGLE_TOKEN_REFRESH_LEASE = config('GOOGLE_TOKEN_REFRESH_LEASE', default=30, cast=int)
+
+# Outbox worker (`manage.py push_google_outbox`) settings
+GOOGLE_OUTBOX_WORKERS = config('GOOGLE_OUTBOX_WORKERS', default=4, cast=int)
+GOOGLE_OUTBOX_MAX_ATTEMPTS = config('GOOGLE_OUTBOX_MAX_ATTEMPTS', default=8, cast=int)
+GOOGLE_OUTBOX_RETRY_BASE = config('GOOGLE_OUTBOX_RETRY_BASE', default=5, cast=int)
+GOOGLE_OUTBOX_RETRY_MAX = config('GOOGLE_OUTBOX_RETRY_MAX', default=3600, cast=int)
+# Seconds before an entry claimed by a crashed worker is picked up again.
+GOOGLE_OUTBOX_LOCK_TIMEOUT = config('GOOGLE_OUTBOX_LOCK_TIMEOUT', default=300, cast=int)
+
+# /api/events/ pagination; clients may ask for up to EVENTS_MAX_PAGE_SIZE with ?page_size=
+EVENTS_PAGE_SIZE = config('EVENTS_PAGE_SIZE', default=100, cast=int)
+EVENTS_MAX_PAGE_SIZE = config('EVENTS_MAX_PAGE_SIZE', default=1000, cast=int)
+
+# Rows fetched and serialized per chunk by the streaming /api/events/export/
+EVENTS_EXPORT_CHUNK_SIZE = config('EVENTS_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Events written per bulk insert when importing an .ics file
+EVENTS_IMPORT_CHUNK_SIZE = config('EVENTS_IMPORT_CHUNK_SIZE', default=1000, cast=int)
+
+# Local expansion of recurring events for /api/events/?start=&end=
+RECURRENCE_CACHE_SIZE = config('RECURRENCE_CACHE_SIZE', default=4096, cast=int)
+RECURRENCE_MAX_OCCURRENCES = config('RECURRENCE_MAX_OCCURRENCES', default=1000, cast=int)
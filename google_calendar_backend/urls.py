@@ -41,7 +41,13 @@ def api_info(request):
             'calendar': {
                 'events': '/api/events/',
                 'event_detail': '/api/events/<id>/',
+                'event_bulk': '/api/events/bulk/',
+                'event_export': '/api/events/export/',
+                'event_ics': '/api/events/ics/',
                 'sync_events': '/api/sync/',
+                'freebusy': '/api/freebusy/',
+                'watch': '/api/watch/',
+                'google_webhook': '/api/webhooks/google/',
                 'calendars': '/api/calendars/'
             },
             'users': {